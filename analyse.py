@@ -0,0 +1,666 @@
+"""
+Hodeløs kupong-analyse for Modelltipset.
+
+Tar NT-kupongen og hentede FotMob-data og gir analyse_resultater og
+spillforslag_alle, de samme strukturene som app.py viser. Importeres av appen,
+men kan også kjøres uten Streamlit, f.eks. fra cron eller i benchmarks:
+
+    python analyse.py                        # gjeldende kupong fra Norsk Tipping
+    python analyse.py --kupong opptak.json   # lagret NT-svar (eller opptak fra FOTMOB_RECORD_DIR)
+    python analyse.py --params backtest_results.json --max-age 6
+
+Skriver kupong_analyse.json (alt) og kupong_analyse.csv (én rad per kamp).
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from backtest_config import DEFAULT_PARAMS
+from fotmob_api import (
+    FOTMOB_LIGA_IDS, SWR_TTL, resolve_team,
+    beregn_form_styrke, beregn_lambda, beregn_poisson_batch, poisson_resultat,
+    hent_nt_kupong, hent_fotmob_tabell_swr, hent_fotmob_team_swr, hent_fotmob_xg_swr,
+)
+
+JSON_FILE = "kupong_analyse.json"
+CSV_FILE = "kupong_analyse.csv"
+
+
+# ─────────────────────────────────────────────
+# KUPONG (NORSK TIPPING)
+# ─────────────────────────────────────────────
+
+def nt_kamper(json_data):
+    """Kampene på NT-kupongen som liste av rader (én dict per kamp)."""
+    kamper = []
+    for dag in json_data.get("gameDays", []):
+        dag_navn = {"MIDWEEK": "Midtuke", "SATURDAY": "Lørdag", "SUNDAY": "Søndag"}.get(
+            dag.get("dayType", ""), dag.get("dayType", ""))
+        game = dag.get("game", {})
+        matches = game.get("matches", [])
+        folk_ft = game.get("tips", {}).get("fullTime", {}).get("peoples", [])
+
+        for i, m in enumerate(matches):
+            folk = folk_ft[i] if i < len(folk_ft) else {}
+            liga = m.get("arrangement", {}).get("name", "")
+            dato_raw = m.get("date", "")
+            dato = dato_raw[:10] if dato_raw else ""
+
+            kamper.append({
+                "Dag": dag_navn,
+                "Kamp": m.get("name", ""),
+                "Hjemmelag": m.get("teams", {}).get("home", {}).get("webName", ""),
+                "Bortelag": m.get("teams", {}).get("away", {}).get("webName", ""),
+                "Liga": liga,
+                "Dato": dato,
+                "Folk H%": folk.get("home", 0),
+                "Folk U%": folk.get("draw", 0),
+                "Folk B%": folk.get("away", 0),
+                "FotmobLigaId": FOTMOB_LIGA_IDS.get(liga),
+            })
+    return kamper
+
+
+def prosesser_nt(json_data):
+    """Kupongen som DataFrame (for visning i appen)."""
+    return pd.DataFrame(nt_kamper(json_data))
+
+
+# ─────────────────────────────────────────────
+# FOTMOB-DATA FOR KUPONGEN
+# ─────────────────────────────────────────────
+
+def hent_kupongdata(kamper, max_age=0, swr_ttl=None):
+    """Henter tabell og xG for kupongens ligaer og lagdata for lagene som trengs,
+    via de prosessvide stale-while-revalidate-cachene i fotmob_api.
+
+    max_age > 0 lar en fersk prosess (CLI) bruke disk-cachen uten forespørsel.
+    swr_ttl overstyrer SWR_TTL for når et cachet svar revalideres (cache-oppvarmingen).
+    Returns: {"liga_data": {liga: tabell (med "versjon")}, "xg": {liga: {lagnavn: xg}},
+              "team_data": {team_id: lagdata}, "utdatert": bool,
+              "versjoner": [(kilde, id, hentetidspunkt)]}
+    """
+    # Appen og cache-oppvarmingen kaller uten max_age; samme cache-nøkkel da
+    ekstra = (max_age,) if max_age else ()
+    data = {"liga_data": {}, "xg": {}, "team_data": {}, "utdatert": False, "versjoner": []}
+
+    liga_ids = {}
+    for rad in kamper:
+        if FOTMOB_LIGA_IDS.get(rad["Liga"]):
+            liga_ids[rad["Liga"]] = FOTMOB_LIGA_IDS[rad["Liga"]]
+    if not liga_ids:
+        return data
+
+    # Ligatabell og xG hentes samtidig for alle ligaer (én rundtur per liga)
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        tabell_futures = {liga: pool.submit(hent_fotmob_tabell_swr.med_versjon, lid, *ekstra, maks_alder=swr_ttl)
+                          for liga, lid in liga_ids.items()}
+        xg_futures = {liga: pool.submit(hent_fotmob_xg_swr.med_versjon, lid, *ekstra, maks_alder=swr_ttl)
+                      for liga, lid in liga_ids.items()}
+        for liga, lid in liga_ids.items():
+            tabell, tabell_utdatert, tabell_versjon = tabell_futures[liga].result()
+            xg, xg_utdatert, xg_versjon = xg_futures[liga].result()
+            data["utdatert"] = data["utdatert"] or tabell_utdatert or xg_utdatert
+            data["versjoner"] += [("tabell", lid, tabell_versjon), ("xg", lid, xg_versjon)]
+            if tabell and tabell.get("teams"):
+                # Hentetidspunktet identifiserer tabellen, så navneindeksen gjenbrukes
+                tabell["versjon"] = (lid, tabell_versjon) if tabell_versjon else None
+                data["liga_data"][liga] = tabell
+            if xg:
+                data["xg"][liga] = xg
+
+    # Lagdata for alle lag som trengs
+    needed_teams = set()
+    for rad in kamper:
+        ld = data["liga_data"].get(rad["Liga"], {})
+        teams = ld.get("teams", {})
+        if teams:
+            for lagnavn in (rad["Hjemmelag"], rad["Bortelag"]):
+                _, stats = resolve_team(teams, lagnavn, rad["Liga"], ld.get("versjon"))
+                if stats and stats.get("team_id"):
+                    needed_teams.add(stats["team_id"])
+
+    def _hent_team(tid):
+        return (tid, *hent_fotmob_team_swr.med_versjon(tid, *ekstra, maks_alder=swr_ttl))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for tid, td, utdatert, versjon in pool.map(_hent_team, needed_teams):
+            data["utdatert"] = data["utdatert"] or utdatert
+            data["versjoner"].append(("team", tid, versjon))
+            if td:
+                data["team_data"][tid] = td
+
+    data["versjoner"].sort(key=str)
+    return data
+
+
+# ─────────────────────────────────────────────
+# INNBYRDES HISTORIKK (H2H)
+# ─────────────────────────────────────────────
+
+def finn_h2h(h_fixtures, b_fixtures, h_team_id, b_team_id):
+    """Finner innbyrdes kamper mellom to lag fra fixture-listene."""
+    if not h_fixtures or not b_fixtures:
+        return []
+
+    h2h = []
+    sett = set()
+    for fx in h_fixtures:
+        opp_id = fx["away_id"] if fx["is_home"] else fx["home_id"]
+        if opp_id == b_team_id:
+            key = f"{fx['home_name']}-{fx['away_name']}-{fx['home_goals']}-{fx['away_goals']}"
+            if key not in sett:
+                sett.add(key)
+                h2h.append(fx)
+
+    # Sorter nyeste først (de er allerede i kronologisk rekkefølge, reverser)
+    h2h.reverse()
+    return h2h[:5]
+
+def h2h_oppsummering(h2h_kamper, h_team_id):
+    """Lager tekstlig oppsummering av H2H."""
+    if not h2h_kamper:
+        return None
+    seire, uavgjort, tap = 0, 0, 0
+    scoret, innsluppet = 0, 0
+    for fx in h2h_kamper:
+        if fx["is_home"]:
+            hg, ag = fx["home_goals"], fx["away_goals"]
+        else:
+            hg, ag = fx["away_goals"], fx["home_goals"]
+        scoret += hg
+        innsluppet += ag
+        if hg > ag:
+            seire += 1
+        elif hg == ag:
+            uavgjort += 1
+        else:
+            tap += 1
+    return {
+        "seire": seire, "uavgjort": uavgjort, "tap": tap,
+        "scoret": scoret, "innsluppet": innsluppet,
+        "kamper": len(h2h_kamper),
+    }
+
+
+# ─────────────────────────────────────────────
+# SPILLFORSLAG
+# ─────────────────────────────────────────────
+
+SPILLFORSLAG_PROFILER = [
+    {"navn": "Lite", "rader": 72, "pris": 72},
+    {"navn": "Middels", "rader": 256, "pris": 256},
+    {"navn": "Stort", "rader": 384, "pris": 384},
+]
+
+
+def generer_spillforslag(analyse_resultater, maal_rader):
+    """Genererer spillforslag for en gitt budsjettgrense (maks rader).
+
+    Algoritme:
+    1. Klassifiser hver kamp: ønsket antall tegn (1/2/3) + hvilke tegn
+    2. Optimaliser: juster opp/ned garderinger så produktet ≤ maal_rader
+    3. Prioriter: helgarder usikre kamper, singel på sikre verdikamper
+
+    Returns: (forslag_liste, faktisk_rader)
+    """
+    n = len(analyse_resultater)
+    if n == 0:
+        return [], 0
+
+    # ── Steg 1: Analyser hver kamp ──
+    kamper = []
+    for i, a in enumerate(analyse_resultater):
+        pr = a["poisson_res"]
+        folk_h, folk_u, folk_b = a["folk_h"], a["folk_u"], a["folk_b"]
+
+        if pr:
+            probs = {"H": pr["H"], "U": pr["U"], "B": pr["B"]}
+            avvik = {"H": pr["H"] - folk_h, "U": pr["U"] - folk_u, "B": pr["B"] - folk_b}
+        else:
+            probs = {"H": folk_h, "U": folk_u, "B": folk_b}
+            avvik = {"H": 0, "U": 0, "B": 0}
+
+        # Sortér utfall: mest sannsynlig først
+        sortert = sorted(probs.items(), key=lambda x: -x[1])
+        topp_prob = sortert[0][1]
+        nest_prob = sortert[1][1]
+        confidence = topp_prob - nest_prob
+        max_avvik = max(avvik.values())
+        max_neg_avvik = min(avvik.values())
+        value_spread = max_avvik - max_neg_avvik
+
+        # Klassifisér ønsket gardering
+        if topp_prob >= 60 and confidence >= 20:
+            onsket = 1  # Svært sikker → singel
+        elif topp_prob >= 45 and confidence >= 10:
+            onsket = 1  # Ganske sikker → singel
+        elif confidence <= 5 or (topp_prob < 38):
+            onsket = 3  # Svært jevn → trippel
+        else:
+            onsket = 2  # Middels → dobbel
+
+        # Velg tegn i prioritert rekkefølge
+        # Primært: høyest modell-sannsynlighet
+        # Sekundært: best verdi (størst positivt avvik mot folk) — spill mot folket!
+        # Tertiært: gjenværende utfall
+        primaer = sortert[0][0]
+        andre = [s for s in sortert[1:]]
+        # Blant de to resterende: velg den med størst verdi (avvik) som sekundær
+        andre_med_verdi = sorted(andre, key=lambda x: -avvik[x[0]])
+        sekundaer = andre_med_verdi[0][0]
+        tertiaer = andre_med_verdi[1][0]
+
+        # Hvis sekundær har mye bedre verdi enn primær, og primær er usikker,
+        # kan vi bytte rekkefølge for singel-tegn (spill verdi!)
+        singel_tegn = primaer
+        if avvik[sekundaer] > avvik[primaer] + 8 and probs[sekundaer] >= 25:
+            singel_tegn = sekundaer  # Verdi-spill: velg det undertippede utfallet
+
+        # Begrunnelse
+        if onsket == 1:
+            if avvik[singel_tegn] > 5:
+                begrunnelse = f"Sikker + verdi på {singel_tegn} ({avvik[singel_tegn]:+.0f}pp vs folk)"
+            elif confidence >= 20:
+                begrunnelse = f"Klar favoritt ({primaer} {topp_prob:.0f}%)"
+            else:
+                begrunnelse = f"Modell-favoritt ({primaer} {topp_prob:.0f}%)"
+        elif onsket == 3:
+            begrunnelse = f"Svært jevn kamp — helgardert"
+        else:
+            if avvik[sekundaer] > 5:
+                begrunnelse = f"Verdi på {sekundaer} ({avvik[sekundaer]:+.0f}pp vs folk)"
+            elif confidence <= 8:
+                begrunnelse = f"Usikker — gardert {primaer}+{sekundaer}"
+            else:
+                begrunnelse = f"Gardert med {sekundaer} ({probs[sekundaer]:.0f}%)"
+
+        kamper.append({
+            "idx": i,
+            "probs": probs,
+            "avvik": avvik,
+            "confidence": confidence,
+            "value_spread": value_spread,
+            "topp_prob": topp_prob,
+            "onsket": onsket,
+            "primaer": primaer,
+            "sekundaer": sekundaer,
+            "tertiaer": tertiaer,
+            "singel_tegn": singel_tegn,
+            "begrunnelse": begrunnelse,
+            "har_modell": pr is not None,
+        })
+
+    # ── Steg 2: Finn eksakt fordeling av singler/dobler/tripler ──
+    # Finn beste kombinasjon av dobler (2) og tripler (3) slik at 2^d * 3^t = maal_rader
+    best_fordeling = (0, 0, 0)  # (produkt, antall_dobler, antall_tripler)
+    for tripler in range(min(n, 8) + 1):
+        for dobler in range(n - tripler + 1):
+            prod = (3 ** tripler) * (2 ** dobler)
+            if prod <= maal_rader and prod > best_fordeling[0]:
+                best_fordeling = (prod, dobler, tripler)
+            if prod > maal_rader:
+                break
+    faktisk_rader = best_fordeling[0]
+    antall_dobler = best_fordeling[1]
+    antall_tripler = best_fordeling[2]
+
+    # Ranger kamper: høy score = bør garderes (usikker + verdi-spredning)
+    gardering_rank = sorted(
+        range(n),
+        key=lambda j: -kamper[j]["confidence"] + kamper[j]["value_spread"] * 0.5,
+        reverse=True,
+    )
+
+    # Tildel: tripler til de som bør garderes mest, dobler til neste, resten singler
+    tegn_per_kamp = [1] * n
+    for rank, j in enumerate(gardering_rank):
+        if rank < antall_tripler:
+            tegn_per_kamp[j] = 3
+        elif rank < antall_tripler + antall_dobler:
+            tegn_per_kamp[j] = 2
+
+    # ── Steg 3: Bygg forslag med valgte tegn og begrunnelse ──
+    forslag = []
+    for j, k in enumerate(kamper):
+        ant = tegn_per_kamp[j]
+        avvik = k["avvik"]
+        if ant == 1:
+            tegn_str = k["singel_tegn"]
+            type_str = "singel"
+            av = avvik.get(tegn_str, 0)
+            if av > 5:
+                begrunnelse = f"Sikker + verdi på {tegn_str} ({av:+.0f}pp vs folk)"
+            elif k["confidence"] >= 20:
+                begrunnelse = f"Klar favoritt ({k['primaer']} {k['topp_prob']:.0f}%)"
+            else:
+                begrunnelse = f"Modell-favoritt ({k['primaer']} {k['topp_prob']:.0f}%)"
+        elif ant == 2:
+            tegn_str = "".join(sorted([k["primaer"], k["sekundaer"]], key="HUB".index))
+            type_str = "dobbel"
+            sek = k["sekundaer"]
+            av_sek = avvik.get(sek, 0)
+            if av_sek > 5:
+                begrunnelse = f"Verdi på {sek} ({av_sek:+.0f}pp vs folk)"
+            elif k["confidence"] <= 8:
+                begrunnelse = f"Jevn kamp — gardert {k['primaer']}+{sek}"
+            else:
+                begrunnelse = f"Gardert med {sek} ({k['probs'][sek]:.0f}%)"
+        else:
+            tegn_str = "HUB"
+            type_str = "trippel"
+            begrunnelse = f"Svært jevn kamp — helgardert"
+
+        forslag.append({
+            "tegn": tegn_str,
+            "type": type_str,
+            "begrunnelse": begrunnelse,
+            "probs": k["probs"],
+            "avvik": k["avvik"],
+        })
+
+    return forslag, faktisk_rader
+
+
+# ─────────────────────────────────────────────
+# KUPONGANALYSE
+# ─────────────────────────────────────────────
+
+def analyser_kupong(kamper, liga_data_cache, xg_cache, team_data_cache, model_params):
+    """Analyserer kupongkampene (nt_kamper) mot hentede FotMob-data.
+
+    Ren funksjon: resultatet avhenger bare av argumentene. Lagdata reduseres til
+    formlisten ("h_lagform"/"b_lagform"), så resultatet er lite å cache.
+
+    Returns: (analyse_resultater, spillforslag_alle)
+    """
+    analyse_resultater = []
+    form_window = model_params.get("form_window", DEFAULT_PARAMS["form_window"])
+
+    for rad in kamper:
+        hjemmelag = rad["Hjemmelag"]
+        bortelag = rad["Bortelag"]
+        liga = rad["Liga"]
+        folk_h, folk_u, folk_b = rad["Folk H%"], rad["Folk U%"], rad["Folk B%"]
+
+        # Hent ligadata
+        ld = liga_data_cache.get(liga, {})
+        teams = ld.get("teams", {})
+        league_avg_home = ld.get("league_avg_home", 1.4)
+        league_avg_away = ld.get("league_avg_away", 1.1)
+
+        # Resolve lag
+        h_fm_navn, h_stats = resolve_team(teams, hjemmelag, liga, ld.get("versjon"))
+        b_fm_navn, b_stats = resolve_team(teams, bortelag, liga, ld.get("versjon"))
+
+        # Hent lagdata og form
+        h_team_id = h_stats.get("team_id") if h_stats else None
+        b_team_id = b_stats.get("team_id") if b_stats else None
+        h_team_data = team_data_cache.get(h_team_id) if h_team_id else None
+        b_team_data = team_data_cache.get(b_team_id) if b_team_id else None
+
+        h_form = beregn_form_styrke(
+            h_team_data["fixtures"], h_team_id, True, form_window=form_window,
+        ) if h_team_data else None
+        b_form = beregn_form_styrke(
+            b_team_data["fixtures"], b_team_id, False, form_window=form_window,
+        ) if b_team_data else None
+
+        # xG
+        xg_data = xg_cache.get(liga, {})
+        h_xg = None
+        b_xg = None
+        if xg_data:
+            # Prøv å matche xG-data med FotMob-navn
+            if h_fm_navn and h_fm_navn in xg_data:
+                h_xg = xg_data[h_fm_navn]
+            if b_fm_navn and b_fm_navn in xg_data:
+                b_xg = xg_data[b_fm_navn]
+
+        # Forventede mål (Poisson kjøres samlet for hele kupongen under)
+        lambdaer = None
+        if h_stats and b_stats:
+            try:
+                lambdaer = beregn_lambda(
+                    h_stats, b_stats, league_avg_home, league_avg_away,
+                    h_form, b_form, h_xg, b_xg,
+                    params=model_params,
+                )
+            except Exception:
+                lambdaer = None
+
+        # H2H
+        h2h_kamper = finn_h2h(
+            h_team_data["fixtures"] if h_team_data else None,
+            b_team_data["fixtures"] if b_team_data else None,
+            h_team_id, b_team_id,
+        )
+        h2h_opps = h2h_oppsummering(h2h_kamper, h_team_id) if h2h_kamper else None
+
+        analyse_resultater.append({
+            "rad": rad,
+            "h_stats": h_stats, "b_stats": b_stats,
+            "h_fm_navn": h_fm_navn, "b_fm_navn": b_fm_navn,
+            "h_lagform": h_team_data.get("form", []) if h_team_data else None,
+            "b_lagform": b_team_data.get("form", []) if b_team_data else None,
+            "h_team_id": h_team_id, "b_team_id": b_team_id,
+            "h_form": h_form, "b_form": b_form,
+            "lambdaer": lambdaer,
+            "h2h_kamper": h2h_kamper, "h2h_opps": h2h_opps,
+            "folk_h": folk_h, "folk_u": folk_u, "folk_b": folk_b,
+            "league_avg_home": league_avg_home,
+            "league_avg_away": league_avg_away,
+        })
+
+    # Poisson for alle kamper med modell i én vektorisert beregning
+    med_modell = [a for a in analyse_resultater if a["lambdaer"]]
+    poisson_batch = beregn_poisson_batch(
+        [a["lambdaer"][0] for a in med_modell],
+        [a["lambdaer"][1] for a in med_modell],
+    ) if med_modell else None
+    batch_idx = {id(a): i for i, a in enumerate(med_modell)}
+
+    for a in analyse_resultater:
+        lambdaer = a.pop("lambdaer")
+        poisson_res = None
+        modell_nivaa = "Ingen modell"
+        if lambdaer:
+            lambda_h, lambda_b, styrke, nivaa = lambdaer
+            poisson_res = poisson_resultat(poisson_batch, batch_idx[id(a)], lambda_h, lambda_b, styrke, nivaa)
+            modell_nivaa = poisson_res["modell_nivaa"]
+
+        # Avvik
+        folk_h, folk_u, folk_b = a["folk_h"], a["folk_u"], a["folk_b"]
+        poi_h = poisson_res["H"] if poisson_res else None
+        poi_u = poisson_res["U"] if poisson_res else None
+        poi_b = poisson_res["B"] if poisson_res else None
+        avvik_poi = [
+            (poi_h - folk_h) if poi_h else None,
+            (poi_u - folk_u) if poi_u else None,
+            (poi_b - folk_b) if poi_b else None,
+        ]
+        max_poi_avvik = max((abs(av) for av in avvik_poi if av is not None), default=0)
+
+        a.update({
+            "poisson_res": poisson_res,
+            "modell_nivaa": modell_nivaa,
+            "avvik_poi": avvik_poi,
+            "max_poi_avvik": max_poi_avvik,
+            "poi_h": poi_h, "poi_u": poi_u, "poi_b": poi_b,
+        })
+
+    # Spillforslag (kun neste kupong = 12 kamper): grupper per dag, velg den tidligste
+    kuponger_per_dag = {}
+    for a in analyse_resultater:
+        kuponger_per_dag.setdefault(a["rad"]["Dag"], []).append(a)
+
+    neste_kupong_dag = None
+    neste_kupong_dato = None
+    neste_kupong_analyser = []
+    for dag, dag_kamper in kuponger_per_dag.items():
+        datoer = [a["rad"]["Dato"] for a in dag_kamper if a["rad"]["Dato"]]
+        min_dato = min(datoer) if datoer else "9999"
+        if neste_kupong_dato is None or min_dato < neste_kupong_dato:
+            neste_kupong_dato = min_dato
+            neste_kupong_dag = dag
+            neste_kupong_analyser = dag_kamper
+
+    spillforslag_alle = {}
+    for profil in SPILLFORSLAG_PROFILER:
+        forslag, rader = generer_spillforslag(neste_kupong_analyser, profil["rader"])
+        spillforslag_alle[profil["navn"].lower()] = {
+            "forslag": forslag,
+            "rader": rader,
+            "profil": profil,
+            "dag": neste_kupong_dag,
+            "dato": neste_kupong_dato,
+            "analyser": neste_kupong_analyser,
+        }
+
+    return analyse_resultater, spillforslag_alle
+
+
+def kupong_nokkel(kamper, data_versjoner, model_params):
+    """Hash av kupongkampene, versjonene av FotMob-dataene og modellparametrene."""
+    innhold = json.dumps([kamper, data_versjoner, model_params], sort_keys=True, default=str)
+    return hashlib.sha1(innhold.encode("utf-8")).hexdigest()
+
+
+# ─────────────────────────────────────────────
+# EKSPORT
+# ─────────────────────────────────────────────
+
+def analyse_til_json(analyse_resultater, spillforslag_alle):
+    """JSON-vennlig utdrag: analysene pluss spillforslag per profil, der hvert
+    forslag har kampnavnet sitt (i stedet for referanser til analysene)."""
+    spillforslag = {}
+    for navn, sf in spillforslag_alle.items():
+        spillforslag[navn] = {
+            "profil": sf["profil"],
+            "dag": sf["dag"],
+            "dato": sf["dato"],
+            "rader": sf["rader"],
+            "forslag": [
+                {"kamp": a["rad"]["Kamp"], **f} for a, f in zip(sf["analyser"], sf["forslag"])
+            ],
+        }
+    return {"analyse_resultater": analyse_resultater, "spillforslag": spillforslag}
+
+
+def skriv_csv(analyse_resultater, spillforslag_alle, path):
+    """Én rad per kamp: folkerekke, modell, avvik og tegn per spillforslag-profil."""
+    tegn = {navn: {id(a): f["tegn"] for a, f in zip(sf["analyser"], sf["forslag"])}
+            for navn, sf in spillforslag_alle.items()}
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=[
+            "dag", "dato", "liga", "kamp", "fotmob_hjemme", "fotmob_borte", "modell_nivaa",
+            "folk_H", "folk_U", "folk_B", "modell_H", "modell_U", "modell_B",
+            "lambda_h", "lambda_b", "max_avvik", *(f"tegn_{navn}" for navn in tegn),
+        ])
+        writer.writeheader()
+        for a in analyse_resultater:
+            rad = a["rad"]
+            pr = a["poisson_res"] or {}
+            writer.writerow({
+                "dag": rad["Dag"],
+                "dato": rad["Dato"],
+                "liga": rad["Liga"],
+                "kamp": rad["Kamp"],
+                "fotmob_hjemme": a["h_fm_navn"],
+                "fotmob_borte": a["b_fm_navn"],
+                "modell_nivaa": a["modell_nivaa"],
+                "folk_H": a["folk_h"],
+                "folk_U": a["folk_u"],
+                "folk_B": a["folk_b"],
+                "modell_H": a["poi_h"],
+                "modell_U": a["poi_u"],
+                "modell_B": a["poi_b"],
+                "lambda_h": pr.get("lambda_h"),
+                "lambda_b": pr.get("lambda_b"),
+                "max_avvik": round(a["max_poi_avvik"], 1),
+                **{f"tegn_{navn}": t.get(id(a), "") for navn, t in tegn.items()},
+            })
+
+
+# ─────────────────────────────────────────────
+# MAIN
+# ─────────────────────────────────────────────
+
+def les_kupong(path):
+    """Leser et lagret NT-svar: rå JSON eller et opptak fra fotmob_api.record_response."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "body" in data and "gameDays" not in data:
+        data = json.loads(data["body"])
+    return data
+
+
+def les_params(path):
+    """Modellparametre fra fil: et params-dict eller backtest_results.json (best_params)."""
+    if not path:
+        return DEFAULT_PARAMS
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {**DEFAULT_PARAMS, **data.get("best_params", data)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Analyserer tippekupongen uten Streamlit og skriver JSON/CSV.")
+    parser.add_argument("--kupong", help="Lagret NT-svar i stedet for å hente gjeldende kupong")
+    parser.add_argument("--params", help="JSON med modellparametre (f.eks. backtest_results.json)")
+    parser.add_argument(
+        "--max-age", type=float, default=SWR_TTL / 3600,
+        help=f"Bruk disk-cachede FotMob-svar yngre enn så mange timer uten forespørsel "
+             f"(default: {SWR_TTL / 3600:g}, 0 = revalider alltid)",
+    )
+    parser.add_argument("--json", default=JSON_FILE, help=f"Utfil for JSON (default: {JSON_FILE})")
+    parser.add_argument("--csv", default=CSV_FILE, help=f"Utfil for CSV (default: {CSV_FILE})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+
+    if args.kupong:
+        nt_json = les_kupong(args.kupong)
+    else:
+        nt_json, feil = hent_nt_kupong()
+        if nt_json is None:
+            print(f"FEIL: Kunne ikke hente Norsk Tipping-data: {feil}")
+            return 1
+
+    kamper = nt_kamper(nt_json)
+    model_params = les_params(args.params)
+    data = hent_kupongdata(kamper, max_age=args.max_age * 3600)
+    hentet = time.perf_counter()
+
+    analyse_resultater, spillforslag_alle = analyser_kupong(
+        kamper, data["liga_data"], data["xg"], data["team_data"], model_params)
+
+    output = {
+        "generert": datetime.now().isoformat(timespec="seconds"),
+        "kupong_nokkel": kupong_nokkel(kamper, data["versjoner"], model_params),
+        "model_params": model_params,
+        **analyse_til_json(analyse_resultater, spillforslag_alle),
+    }
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2, default=str)
+    skriv_csv(analyse_resultater, spillforslag_alle, args.csv)
+
+    ferdig = time.perf_counter()
+    print(f"{len(analyse_resultater)} kamper, {len(data['liga_data'])} ligaer, {len(data['team_data'])} lag "
+          f"— henting {hentet - start:.2f}s, analyse og skriving {ferdig - hentet:.2f}s")
+    print(f"Skrev {args.json} og {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,9 @@
 import streamlit as st
 import pandas as pd
-import requests
 from datetime import datetime, date
 import numpy as np
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 try:
     import gspread
@@ -14,14 +12,16 @@ try:
 except ImportError:
     GSPREAD_AVAILABLE = False
 
+from analyse import prosesser_nt, hent_kupongdata, analyser_kupong, kupong_nokkel
 from backtest_config import DEFAULT_PARAMS
+from cache_warmer import start_cache_warmer
 from fotmob_api import (
-    FOTMOB_LIGA_IDS, FOTMOB_HEADERS, TEAM_NAME_OVERRIDES,
-    _normalize, resolve_team, _parse_table_row,
-    hent_fotmob_tabell as _hent_fotmob_tabell,
-    hent_fotmob_team as _hent_fotmob_team,
-    hent_fotmob_xg as _hent_fotmob_xg,
-    beregn_styrke, beregn_form_styrke, beregn_dyp_poisson,
+    FOTMOB_HEADERS, TEAM_NAME_OVERRIDES,
+    _normalize, _parse_table_row,
+    hent_fotmob_team_swr, swr_clear,
+    beregn_styrke,
+    hent_nt_kupong, single_flight_stats,
+    ALIAS_REGISTRY_FILE, alias_oppslag, tvetydige_aliaser,
 )
 
 st.set_page_config(page_title="Modelltipset", page_icon="⚽", layout="wide")
@@ -260,117 +260,31 @@ html, body, [data-testid="stAppViewContainer"] {
 """
 st.markdown(_GLOBAL_CSS, unsafe_allow_html=True)
 
-# ─────────────────────────────────────────────
-# KONSTANTER
-# ─────────────────────────────────────────────
-
-NT_API = "https://api.norsk-tipping.no/PoolGamesSportInfo/v1/api/tipping/live-info"
-
 # ─────────────────────────────────────────────
 # DATAHENTING: NORSK TIPPING TIPPEKUPONG
 # ─────────────────────────────────────────────
 
 @st.cache_data(ttl=180)
 def hent_nt_data():
-    try:
-        r = requests.get(NT_API, timeout=10)
-        r.raise_for_status()
-        return r.json(), None
-    except Exception as e:
-        return None, str(e)
-
-def prosesser_nt(json_data):
-    kamper = []
-    for dag in json_data.get("gameDays", []):
-        dag_navn = {"MIDWEEK": "Midtuke", "SATURDAY": "Lørdag", "SUNDAY": "Søndag"}.get(
-            dag.get("dayType", ""), dag.get("dayType", ""))
-        game = dag.get("game", {})
-        matches = game.get("matches", [])
-        folk_ft = game.get("tips", {}).get("fullTime", {}).get("peoples", [])
-
-        for i, m in enumerate(matches):
-            folk = folk_ft[i] if i < len(folk_ft) else {}
-            liga = m.get("arrangement", {}).get("name", "")
-            dato_raw = m.get("date", "")
-            dato = dato_raw[:10] if dato_raw else ""
-
-            kamper.append({
-                "Dag": dag_navn,
-                "Kamp": m.get("name", ""),
-                "Hjemmelag": m.get("teams", {}).get("home", {}).get("webName", ""),
-                "Bortelag": m.get("teams", {}).get("away", {}).get("webName", ""),
-                "Liga": liga,
-                "Dato": dato,
-                "Folk H%": folk.get("home", 0),
-                "Folk U%": folk.get("draw", 0),
-                "Folk B%": folk.get("away", 0),
-                "FotmobLigaId": FOTMOB_LIGA_IDS.get(liga),
-            })
-    return pd.DataFrame(kamper)
+    return hent_nt_kupong()
 
 # ─────────────────────────────────────────────
 # FOTMOB CACHED WRAPPERS
 # ─────────────────────────────────────────────
 
-@st.cache_data(ttl=3600)
-def hent_fotmob_tabell(liga_id):
-    return _hent_fotmob_tabell(liga_id)
+# Stale-while-revalidate: utløpte data serveres straks og oppdateres i bakgrunnen.
+# Cachene ligger i fotmob_api, så de overlever at app.py kjøres på nytt
+# (kupongens data hentes via analyse.hent_kupongdata, som bruker de samme cachene).
+hent_fotmob_team = hent_fotmob_team_swr
 
-@st.cache_data(ttl=3600)
-def hent_fotmob_team(team_id):
-    return _hent_fotmob_team(team_id)
 
-@st.cache_data(ttl=3600)
-def hent_fotmob_xg(liga_id):
-    return _hent_fotmob_xg(liga_id)
+@st.cache_resource
+def _start_cache_warmer():
+    """Starter bakgrunnsoppvarmingen av FotMob-cachen én gang per server."""
+    return start_cache_warmer()
 
-# ─────────────────────────────────────────────
-# INNBYRDES HISTORIKK (H2H)
-# ─────────────────────────────────────────────
 
-def finn_h2h(h_fixtures, b_fixtures, h_team_id, b_team_id):
-    """Finner innbyrdes kamper mellom to lag fra fixture-listene."""
-    if not h_fixtures or not b_fixtures:
-        return []
-
-    h2h = []
-    sett = set()
-    for fx in h_fixtures:
-        opp_id = fx["away_id"] if fx["is_home"] else fx["home_id"]
-        if opp_id == b_team_id:
-            key = f"{fx['home_name']}-{fx['away_name']}-{fx['home_goals']}-{fx['away_goals']}"
-            if key not in sett:
-                sett.add(key)
-                h2h.append(fx)
-
-    # Sorter nyeste først (de er allerede i kronologisk rekkefølge, reverser)
-    h2h.reverse()
-    return h2h[:5]
-
-def h2h_oppsummering(h2h_kamper, h_team_id):
-    """Lager tekstlig oppsummering av H2H."""
-    if not h2h_kamper:
-        return None
-    seire, uavgjort, tap = 0, 0, 0
-    scoret, innsluppet = 0, 0
-    for fx in h2h_kamper:
-        if fx["is_home"]:
-            hg, ag = fx["home_goals"], fx["away_goals"]
-        else:
-            hg, ag = fx["away_goals"], fx["home_goals"]
-        scoret += hg
-        innsluppet += ag
-        if hg > ag:
-            seire += 1
-        elif hg == ag:
-            uavgjort += 1
-        else:
-            tap += 1
-    return {
-        "seire": seire, "uavgjort": uavgjort, "tap": tap,
-        "scoret": scoret, "innsluppet": innsluppet,
-        "kamper": len(h2h_kamper),
-    }
+_start_cache_warmer()
 
 # ─────────────────────────────────────────────
 # HJELPEFUNKSJONER VISNING
@@ -434,182 +348,14 @@ def modell_nivaa_badge(nivaa):
     )
 
 # ─────────────────────────────────────────────
-# SPILLFORSLAG
+# KUPONGANALYSE (analyse.py)
 # ─────────────────────────────────────────────
 
-SPILLFORSLAG_PROFILER = [
-    {"navn": "Lite", "rader": 72, "pris": 72},
-    {"navn": "Middels", "rader": 256, "pris": 256},
-    {"navn": "Stort", "rader": 384, "pris": 384},
-]
-
-
-def generer_spillforslag(analyse_resultater, maal_rader):
-    """Genererer spillforslag for en gitt budsjettgrense (maks rader).
-
-    Algoritme:
-    1. Klassifiser hver kamp: ønsket antall tegn (1/2/3) + hvilke tegn
-    2. Optimaliser: juster opp/ned garderinger så produktet ≤ maal_rader
-    3. Prioriter: helgarder usikre kamper, singel på sikre verdikamper
-
-    Returns: (forslag_liste, faktisk_rader)
-    """
-    n = len(analyse_resultater)
-    if n == 0:
-        return [], 0
-
-    # ── Steg 1: Analyser hver kamp ──
-    kamper = []
-    for i, a in enumerate(analyse_resultater):
-        pr = a["poisson_res"]
-        folk_h, folk_u, folk_b = a["folk_h"], a["folk_u"], a["folk_b"]
-
-        if pr:
-            probs = {"H": pr["H"], "U": pr["U"], "B": pr["B"]}
-            avvik = {"H": pr["H"] - folk_h, "U": pr["U"] - folk_u, "B": pr["B"] - folk_b}
-        else:
-            probs = {"H": folk_h, "U": folk_u, "B": folk_b}
-            avvik = {"H": 0, "U": 0, "B": 0}
-
-        # Sortér utfall: mest sannsynlig først
-        sortert = sorted(probs.items(), key=lambda x: -x[1])
-        topp_prob = sortert[0][1]
-        nest_prob = sortert[1][1]
-        confidence = topp_prob - nest_prob
-        max_avvik = max(avvik.values())
-        max_neg_avvik = min(avvik.values())
-        value_spread = max_avvik - max_neg_avvik
-
-        # Klassifisér ønsket gardering
-        if topp_prob >= 60 and confidence >= 20:
-            onsket = 1  # Svært sikker → singel
-        elif topp_prob >= 45 and confidence >= 10:
-            onsket = 1  # Ganske sikker → singel
-        elif confidence <= 5 or (topp_prob < 38):
-            onsket = 3  # Svært jevn → trippel
-        else:
-            onsket = 2  # Middels → dobbel
-
-        # Velg tegn i prioritert rekkefølge
-        # Primært: høyest modell-sannsynlighet
-        # Sekundært: best verdi (størst positivt avvik mot folk) — spill mot folket!
-        # Tertiært: gjenværende utfall
-        primaer = sortert[0][0]
-        andre = [s for s in sortert[1:]]
-        # Blant de to resterende: velg den med størst verdi (avvik) som sekundær
-        andre_med_verdi = sorted(andre, key=lambda x: -avvik[x[0]])
-        sekundaer = andre_med_verdi[0][0]
-        tertiaer = andre_med_verdi[1][0]
-
-        # Hvis sekundær har mye bedre verdi enn primær, og primær er usikker,
-        # kan vi bytte rekkefølge for singel-tegn (spill verdi!)
-        singel_tegn = primaer
-        if avvik[sekundaer] > avvik[primaer] + 8 and probs[sekundaer] >= 25:
-            singel_tegn = sekundaer  # Verdi-spill: velg det undertippede utfallet
-
-        # Begrunnelse
-        if onsket == 1:
-            if avvik[singel_tegn] > 5:
-                begrunnelse = f"Sikker + verdi på {singel_tegn} ({avvik[singel_tegn]:+.0f}pp vs folk)"
-            elif confidence >= 20:
-                begrunnelse = f"Klar favoritt ({primaer} {topp_prob:.0f}%)"
-            else:
-                begrunnelse = f"Modell-favoritt ({primaer} {topp_prob:.0f}%)"
-        elif onsket == 3:
-            begrunnelse = f"Svært jevn kamp — helgardert"
-        else:
-            if avvik[sekundaer] > 5:
-                begrunnelse = f"Verdi på {sekundaer} ({avvik[sekundaer]:+.0f}pp vs folk)"
-            elif confidence <= 8:
-                begrunnelse = f"Usikker — gardert {primaer}+{sekundaer}"
-            else:
-                begrunnelse = f"Gardert med {sekundaer} ({probs[sekundaer]:.0f}%)"
-
-        kamper.append({
-            "idx": i,
-            "probs": probs,
-            "avvik": avvik,
-            "confidence": confidence,
-            "value_spread": value_spread,
-            "topp_prob": topp_prob,
-            "onsket": onsket,
-            "primaer": primaer,
-            "sekundaer": sekundaer,
-            "tertiaer": tertiaer,
-            "singel_tegn": singel_tegn,
-            "begrunnelse": begrunnelse,
-            "har_modell": pr is not None,
-        })
-
-    # ── Steg 2: Finn eksakt fordeling av singler/dobler/tripler ──
-    # Finn beste kombinasjon av dobler (2) og tripler (3) slik at 2^d * 3^t = maal_rader
-    best_fordeling = (0, 0, 0)  # (produkt, antall_dobler, antall_tripler)
-    for tripler in range(min(n, 8) + 1):
-        for dobler in range(n - tripler + 1):
-            prod = (3 ** tripler) * (2 ** dobler)
-            if prod <= maal_rader and prod > best_fordeling[0]:
-                best_fordeling = (prod, dobler, tripler)
-            if prod > maal_rader:
-                break
-    faktisk_rader = best_fordeling[0]
-    antall_dobler = best_fordeling[1]
-    antall_tripler = best_fordeling[2]
-
-    # Ranger kamper: høy score = bør garderes (usikker + verdi-spredning)
-    gardering_rank = sorted(
-        range(n),
-        key=lambda j: -kamper[j]["confidence"] + kamper[j]["value_spread"] * 0.5,
-        reverse=True,
-    )
-
-    # Tildel: tripler til de som bør garderes mest, dobler til neste, resten singler
-    tegn_per_kamp = [1] * n
-    for rank, j in enumerate(gardering_rank):
-        if rank < antall_tripler:
-            tegn_per_kamp[j] = 3
-        elif rank < antall_tripler + antall_dobler:
-            tegn_per_kamp[j] = 2
-
-    # ── Steg 3: Bygg forslag med valgte tegn og begrunnelse ──
-    forslag = []
-    for j, k in enumerate(kamper):
-        ant = tegn_per_kamp[j]
-        avvik = k["avvik"]
-        if ant == 1:
-            tegn_str = k["singel_tegn"]
-            type_str = "singel"
-            av = avvik.get(tegn_str, 0)
-            if av > 5:
-                begrunnelse = f"Sikker + verdi på {tegn_str} ({av:+.0f}pp vs folk)"
-            elif k["confidence"] >= 20:
-                begrunnelse = f"Klar favoritt ({k['primaer']} {k['topp_prob']:.0f}%)"
-            else:
-                begrunnelse = f"Modell-favoritt ({k['primaer']} {k['topp_prob']:.0f}%)"
-        elif ant == 2:
-            tegn_str = "".join(sorted([k["primaer"], k["sekundaer"]], key="HUB".index))
-            type_str = "dobbel"
-            sek = k["sekundaer"]
-            av_sek = avvik.get(sek, 0)
-            if av_sek > 5:
-                begrunnelse = f"Verdi på {sek} ({av_sek:+.0f}pp vs folk)"
-            elif k["confidence"] <= 8:
-                begrunnelse = f"Jevn kamp — gardert {k['primaer']}+{sek}"
-            else:
-                begrunnelse = f"Gardert med {sek} ({k['probs'][sek]:.0f}%)"
-        else:
-            tegn_str = "HUB"
-            type_str = "trippel"
-            begrunnelse = f"Svært jevn kamp — helgardert"
-
-        forslag.append({
-            "tegn": tegn_str,
-            "type": type_str,
-            "begrunnelse": begrunnelse,
-            "probs": k["probs"],
-            "avvik": k["avvik"],
-        })
-
-    return forslag, faktisk_rader
+@st.cache_data(max_entries=32, show_spinner=False)
+def analyser_kupong_cached(nokkel, _kamper, _liga_data_cache, _xg_cache, _team_data_cache, _model_params):
+    """analyser_kupong cachet på nokkel (kupong_nokkel); argumentene med _ hashes ikke.
+    En omkjøring av appen med uendrede data gir bare visningskostnaden."""
+    return analyser_kupong(_kamper, _liga_data_cache, _xg_cache, _team_data_cache, _model_params)
 
 
 # ─────────────────────────────────────────────
@@ -784,6 +530,17 @@ def hent_historikk_data():
     except Exception:
         return pd.DataFrame()
 
+def samme_kampdato(fx_dato, kupong_dato, toleranse_dager=1):
+    """Om en FotMob-kamp (UTC-tidspunkt) hører til kupongdatoen (lokal dato).
+    En dags toleranse dekker kveldskamper som havner på neste dag i UTC."""
+    try:
+        d1 = date.fromisoformat(str(fx_dato)[:10])
+        d2 = date.fromisoformat(str(kupong_dato)[:10])
+    except ValueError:
+        return False
+    return abs((d1 - d2).days) <= toleranse_dager
+
+
 def oppdater_resultater():
     """Oppdaterer resultater for kamper som er ferdigspilt. Returnerer antall oppdatert."""
     if not sheets_available():
@@ -806,6 +563,11 @@ def oppdater_resultater():
 
             h_team_id = row.get("h_team_id")
             b_team_id = row.get("b_team_id")
+            # Rader lagret uten team_id (laget ble ikke funnet da) slås opp i alias-registeret
+            if not h_team_id:
+                h_team_id = (alias_oppslag(row.get("liga", ""), row.get("hjemmelag", "")) or {}).get("team_id")
+            if not b_team_id:
+                b_team_id = (alias_oppslag(row.get("liga", ""), row.get("bortelag", "")) or {}).get("team_id")
             if not h_team_id or not b_team_id:
                 continue
 
@@ -820,9 +582,12 @@ def oppdater_resultater():
             if not team_data:
                 continue
 
-            # Finn kampen mot bortelaget
+            # Finn kampen mot bortelaget på kupongdatoen. Fixture-lageret spenner over flere
+            # sesonger, så uten datosjekk ville en utsatt kamp fått fjorårets resultat.
             for fx in reversed(team_data.get("fixtures", [])):
-                if fx["home_id"] == h_team_id and fx["away_id"] == b_team_id:
+                if (fx["home_id"] == h_team_id and fx["away_id"] == b_team_id
+                        and fx.get("home_goals") is not None and fx.get("away_goals") is not None
+                        and samme_kampdato(fx.get("date", ""), row["dato"])):
                     hm = fx["home_goals"]
                     bm = fx["away_goals"]
                     if hm > bm:
@@ -906,53 +671,32 @@ st.success(f"Hentet {len(df)} kamper fra Norsk Tipping")
 liga_data_cache = {}  # liga → {"teams": {...}, "league_avg_home": ..., "league_avg_away": ...}
 xg_cache = {}         # liga → {lagnavn: xg}
 team_data_cache = {}   # team_id → team data
+fotmob_utdatert = False  # minst ett FotMob-svar er eldre enn TTL (oppdateres i bakgrunnen)
+data_versjoner = []    # (kilde, id, hentetidspunkt) for hvert FotMob-svar — nøkkel for analysecachen
 
-ligaer = df[df["FotmobLigaId"].notna()]["Liga"].unique()
-if len(ligaer) > 0:
+if df["FotmobLigaId"].notna().any():
     with st.spinner("Henter lagstatistikk fra FotMob..."):
-        # Parallell henting av ligatabell + xG
-        def _hent_liga(liga):
-            lid = FOTMOB_LIGA_IDS.get(liga)
-            if not lid:
-                return liga, None, None
-            data = hent_fotmob_tabell(lid)
-            xg = hent_fotmob_xg(lid)
-            return liga, data, xg
-
-        with ThreadPoolExecutor(max_workers=6) as pool:
-            for liga, data, xg in pool.map(_hent_liga, ligaer):
-                if data and data.get("teams"):
-                    liga_data_cache[liga] = data
-                if xg:
-                    xg_cache[liga] = xg
-
-    # Hent lagdata for alle lag som trengs
-    needed_teams = set()
-    for _, rad in df.iterrows():
-        liga = rad["Liga"]
-        ld = liga_data_cache.get(liga, {})
-        teams = ld.get("teams", {})
-        if teams:
-            _, h_stats = resolve_team(teams, rad["Hjemmelag"])
-            _, b_stats = resolve_team(teams, rad["Bortelag"])
-            if h_stats and h_stats.get("team_id"):
-                needed_teams.add(h_stats["team_id"])
-            if b_stats and b_stats.get("team_id"):
-                needed_teams.add(b_stats["team_id"])
-
-    if needed_teams:
-        with st.spinner(f"Henter detaljert lagdata for {len(needed_teams)} lag..."):
-            # Parallell henting av lagdata — største flaskehals
-            def _hent_team(tid):
-                return tid, hent_fotmob_team(tid)
-
-            with ThreadPoolExecutor(max_workers=8) as pool:
-                for tid, td in pool.map(_hent_team, needed_teams):
-                    if td:
-                        team_data_cache[tid] = td
+        _fotmob = hent_kupongdata(df.to_dict("records"))
+    liga_data_cache = _fotmob["liga_data"]
+    xg_cache = _fotmob["xg"]
+    team_data_cache = _fotmob["team_data"]
+    fotmob_utdatert = _fotmob["utdatert"]
+    data_versjoner = _fotmob["versjoner"]
+
+    # Usikre lagkoblinger på denne kupongen (flere like gode FotMob-kandidater)
+    kupong_lag = set(zip(df["Liga"], df["Hjemmelag"])) | set(zip(df["Liga"], df["Bortelag"]))
+    usikre = [e for e in tvetydige_aliaser() if (e["liga"], e["nt_navn"]) in kupong_lag]
+    if usikre:
+        st.warning(
+            "Usikre lagkoblinger: "
+            + ", ".join(f"{e['nt_navn']} → {e['fotmob_navn']} (også {', '.join(e['kandidater'][1:])})" for e in usikre)
+            + f". Rett team_id og sett \"bekreftet\": true i {os.path.basename(ALIAS_REGISTRY_FILE)}."
+        )
 
     if liga_data_cache:
         st.success(f"Hentet statistikk for {len(liga_data_cache)} ligaer fra FotMob")
+    if fotmob_utdatert:
+        st.caption("⏳ Viser mellomlagrede FotMob-data som er over en time gamle — oppdateres i bakgrunnen.")
 
 # ─── Forklaring ───
 with st.expander("Slik leser du analysen"):
@@ -988,9 +732,16 @@ df_vis = df[df["Dag"].isin(dag_valg)].copy()
 bare_verdi = st.sidebar.checkbox("Vis bare kamper med potensielt verdispill")
 min_avvik = st.sidebar.slider("Minste modell-avvik å vise (pp)", 0, 20, 0)
 
+_sf = single_flight_stats()
+_sf_kall = sum(v["kall"] for v in _sf.values())
+if _sf_kall:
+    _sf_delt = sum(v["delt"] for v in _sf.values())
+    st.sidebar.caption(f"FotMob: {_sf_kall - _sf_delt} forespørsler, {_sf_delt} delt med samtidige økter")
+
 # ─── Oppdater ───
 if st.button("Oppdater alle data"):
     st.cache_data.clear()
+    swr_clear()
     st.rerun()
 
 st.divider()
@@ -1006,132 +757,17 @@ value_threshold = model_params.get("value_threshold_pp", DEFAULT_PARAMS["value_t
 # BEREGN ANALYSE FOR ALLE KAMPER
 # ─────────────────────────────────────────────
 
-analyse_resultater = []
-
-for _, rad in df_vis.iterrows():
-    hjemmelag = rad["Hjemmelag"]
-    bortelag = rad["Bortelag"]
-    liga = rad["Liga"]
-    folk_h, folk_u, folk_b = rad["Folk H%"], rad["Folk U%"], rad["Folk B%"]
-
-    # Hent ligadata
-    ld = liga_data_cache.get(liga, {})
-    teams = ld.get("teams", {})
-    league_avg_home = ld.get("league_avg_home", 1.4)
-    league_avg_away = ld.get("league_avg_away", 1.1)
-
-    # Resolve lag
-    h_fm_navn, h_stats = resolve_team(teams, hjemmelag)
-    b_fm_navn, b_stats = resolve_team(teams, bortelag)
-
-    # Hent lagdata og form
-    h_team_id = h_stats.get("team_id") if h_stats else None
-    b_team_id = b_stats.get("team_id") if b_stats else None
-    h_team_data = team_data_cache.get(h_team_id) if h_team_id else None
-    b_team_data = team_data_cache.get(b_team_id) if b_team_id else None
-
-    h_form = beregn_form_styrke(
-        h_team_data["fixtures"] if h_team_data else None, h_team_id, True,
-        form_window=model_params.get("form_window", DEFAULT_PARAMS["form_window"]),
-    ) if h_team_data else None
-    b_form = beregn_form_styrke(
-        b_team_data["fixtures"] if b_team_data else None, b_team_id, False,
-        form_window=model_params.get("form_window", DEFAULT_PARAMS["form_window"]),
-    ) if b_team_data else None
-
-    # xG
-    xg_data = xg_cache.get(liga, {})
-    h_xg = None
-    b_xg = None
-    if xg_data:
-        # Prøv å matche xG-data med FotMob-navn
-        if h_fm_navn and h_fm_navn in xg_data:
-            h_xg = xg_data[h_fm_navn]
-        if b_fm_navn and b_fm_navn in xg_data:
-            b_xg = xg_data[b_fm_navn]
-
-    # Poisson
-    poisson_res = None
-    modell_nivaa = "Ingen modell"
-    if h_stats and b_stats:
-        poisson_res = beregn_dyp_poisson(
-            h_stats, b_stats, league_avg_home, league_avg_away,
-            h_form, b_form, h_xg, b_xg,
-            params=model_params,
-        )
-        if poisson_res:
-            modell_nivaa = poisson_res["modell_nivaa"]
-
-    # H2H
-    h2h_kamper = finn_h2h(
-        h_team_data["fixtures"] if h_team_data else None,
-        b_team_data["fixtures"] if b_team_data else None,
-        h_team_id, b_team_id,
-    )
-    h2h_opps = h2h_oppsummering(h2h_kamper, h_team_id) if h2h_kamper else None
-
-    # Avvik
-    poi_h = poisson_res["H"] if poisson_res else None
-    poi_u = poisson_res["U"] if poisson_res else None
-    poi_b = poisson_res["B"] if poisson_res else None
-    avvik_poi = [
-        (poi_h - folk_h) if poi_h else None,
-        (poi_u - folk_u) if poi_u else None,
-        (poi_b - folk_b) if poi_b else None,
-    ]
-    max_poi_avvik = max((abs(a) for a in avvik_poi if a is not None), default=0)
-
-    analyse_resultater.append({
-        "rad": rad,
-        "h_stats": h_stats, "b_stats": b_stats,
-        "h_fm_navn": h_fm_navn, "b_fm_navn": b_fm_navn,
-        "h_team_data": h_team_data, "b_team_data": b_team_data,
-        "h_team_id": h_team_id, "b_team_id": b_team_id,
-        "h_form": h_form, "b_form": b_form,
-        "poisson_res": poisson_res,
-        "modell_nivaa": modell_nivaa,
-        "h2h_kamper": h2h_kamper, "h2h_opps": h2h_opps,
-        "avvik_poi": avvik_poi,
-        "max_poi_avvik": max_poi_avvik,
-        "folk_h": folk_h, "folk_u": folk_u, "folk_b": folk_b,
-        "poi_h": poi_h, "poi_u": poi_u, "poi_b": poi_b,
-        "league_avg_home": league_avg_home,
-        "league_avg_away": league_avg_away,
-    })
-
-# ─────────────────────────────────────────────
-# GENERER SPILLFORSLAG (kun neste kupong = 12 kamper)
-# ─────────────────────────────────────────────
+# Cachet på (kupong, FotMob-versjoner, modellparametre): omkjøringer med uendrede data gir bare visning
+_kamper = df_vis.to_dict("records")
+analyse_resultater, spillforslag_alle = analyser_kupong_cached(
+    kupong_nokkel(_kamper, data_versjoner, model_params),
+    _kamper, liga_data_cache, xg_cache, team_data_cache, model_params,
+)
 
-# Finn neste kupong: grupper analyse_resultater per dag, velg den tidligste
-_kuponger_per_dag = {}
-for a in analyse_resultater:
-    dag = a["rad"]["Dag"]
-    _kuponger_per_dag.setdefault(dag, []).append(a)
-
-# Velg kupongen med tidligst dato (= neste kupong)
-neste_kupong_dag = None
-neste_kupong_dato = None
-neste_kupong_analyser = []
-for dag, kamper in _kuponger_per_dag.items():
-    datoer = [a["rad"]["Dato"] for a in kamper if a["rad"]["Dato"]]
-    min_dato = min(datoer) if datoer else "9999"
-    if neste_kupong_dato is None or min_dato < neste_kupong_dato:
-        neste_kupong_dato = min_dato
-        neste_kupong_dag = dag
-        neste_kupong_analyser = kamper
-
-spillforslag_alle = {}
-for profil in SPILLFORSLAG_PROFILER:
-    forslag, rader = generer_spillforslag(neste_kupong_analyser, profil["rader"])
-    spillforslag_alle[profil["navn"].lower()] = {
-        "forslag": forslag,
-        "rader": rader,
-        "profil": profil,
-        "dag": neste_kupong_dag,
-        "dato": neste_kupong_dato,
-        "analyser": neste_kupong_analyser,
-    }
+_neste_kupong = next(iter(spillforslag_alle.values()))
+neste_kupong_dag = _neste_kupong["dag"]
+neste_kupong_dato = _neste_kupong["dato"]
+neste_kupong_analyser = _neste_kupong["analyser"]
 
 # ─────────────────────────────────────────────
 # LAGRE KUPONG AUTOMATISK
@@ -1489,7 +1125,7 @@ with tab_analyse:
                             st.caption(f"Fant ikke {bortelag} i FotMob-tabellen")
 
                 # ════ DETALJERT ANALYSE (under kolonnene) ════
-                if poisson_res or a["h_team_data"] or a["b_team_data"]:
+                if poisson_res or a["h_lagform"] is not None or a["b_lagform"] is not None:
                     st.divider()
 
                     # Styrkerating
@@ -1511,17 +1147,17 @@ with tab_analyse:
                                 st.caption(f"Siste {bf['kamper']} bortekamper: {bf['scoret_snitt']:.1f} scoret, {bf['innsluppet_snitt']:.1f} innsluppet per kamp")
 
                     # Form (siste 5)
-                    if a["h_team_data"] or a["b_team_data"]:
+                    if a["h_lagform"] is not None or a["b_lagform"] is not None:
                         st.markdown("#### Form (siste 5)")
                         f1, f2 = st.columns(2)
                         with f1:
-                            h_form_data = a["h_team_data"]["form"] if a["h_team_data"] else []
+                            h_form_data = a["h_lagform"] or []
                             if h_form_data:
                                 st.markdown(f"**{hjemmelag}:** {form_bokser(h_form_data)}", unsafe_allow_html=True)
                             else:
                                 st.caption(f"{hjemmelag}: form ikke tilgjengelig")
                         with f2:
-                            b_form_data = a["b_team_data"]["form"] if a["b_team_data"] else []
+                            b_form_data = a["b_lagform"] or []
                             if b_form_data:
                                 st.markdown(f"**{bortelag}:** {form_bokser(b_form_data)}", unsafe_allow_html=True)
                             else:
@@ -1814,6 +1450,7 @@ if tab_historikk is not None:
             with hcol2:
                 if st.button("Oppdater resultater"):
                     st.cache_data.clear()
+                    swr_clear()
                     with st.spinner("Oppdaterer resultater fra FotMob..."):
                         antall_oppdatert = oppdater_resultater()
                     if antall_oppdatert > 0:
@@ -6,23 +6,59 @@ Henter historiske kamper fra FotMob, kjører walk-forward simulering
 med grid search over modellparametre.
 """
 
+import hashlib
 import json
 import os
-import time
 import csv
 import math
+import argparse
+import asyncio
+import sqlite3
+import threading
+import time
+import zlib
 import itertools
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy.optimize import minimize
 
-from backtest_config import DEFAULT_PARAMS, PARAM_GRID, MIN_MATCHES_BEFORE_EVAL, TRAIN_RATIO
+from backtest_config import (
+    DEFAULT_PARAMS, PARAM_GRID, PARAM_GRID_FINE, PARAM_BOUNDS, MIN_MATCHES_BEFORE_EVAL, TRAIN_RATIO,
+)
 from fotmob_api import (
-    FOTMOB_LIGA_IDS, hent_fotmob_tabell, hent_fotmob_team,
-    beregn_styrke, beregn_form_styrke, beregn_dyp_poisson,
+    FOTMOB_LIGA_IDS, RECORD_DIR, hent_fotmob_tabell, hent_fotmob_team,
+    beregn_styrke, beregn_form_styrke, beregn_hub_batch,
 )
 
 CACHE_DIR = os.path.join(os.path.dirname(__file__), "backtest_cache")
+# Én SQLite-database med komprimerte FotMob-svar (erstatter league_<id>.json/team_<id>.json)
+CACHE_DB = os.path.join(CACHE_DIR, "cache.sqlite")
+CACHE_SCHEMA_VERSION = 1
 RESULTS_FILE = os.path.join(os.path.dirname(__file__), "backtest_results.json")
 DETAILS_FILE = os.path.join(os.path.dirname(__file__), "backtest_details.csv")
+# Append-only logg med train-metrics per kombinasjon, så avbrutte grid search kan gjenopptas
+RESULT_STORE_FILE = os.path.join(os.path.dirname(__file__), "backtest_grid_store.jsonl")
+# Versjon av evalueringen (features, lambda, metrics). Økes når endringer gir andre
+# train-metrics for samme korpus og parametre, så gamle rader i lageret ikke gjenbrukes.
+EVAL_VERSION = 2
+
+# Oppføringer i backtest_cache eldre enn dette (sekunder) revalideres mot FotMob
+CACHE_MAX_AGE = 24 * 3600
+
+# Datahenting: forespørsler per sekund (token bucket) og maks samtidige forespørsler
+FETCH_RATE = 3.0
+FETCH_CONCURRENCY = 6
+
+# Maks antall tall per pmf-tabell per bit i evaluate_combo_tensor (~8 MB, cache-vennlig)
+TENSOR_MAX_ELEMENTER = 1_000_000
+
+# Tilstand i arbeiderprosesser ved parallell grid search (se _init_grid_worker)
+_WORKER_STATE = {}
+
+# Memoiserte features per ligapartisjon (se build_feature_matrices)
+_FEATURE_CACHE = {}
 
 # Ligaer å backteste (kun nasjonale ligaer, ikke cup/europa)
 BACKTEST_LEAGUES = {
@@ -46,77 +82,239 @@ def ensure_cache_dir():
     os.makedirs(CACHE_DIR, exist_ok=True)
 
 
-def cache_path(kind, entity_id):
-    return os.path.join(CACHE_DIR, f"{kind}_{entity_id}.json")
-
-
-def load_cached(kind, entity_id):
-    path = cache_path(kind, entity_id)
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
-
-
-def save_cached(kind, entity_id, data):
-    path = cache_path(kind, entity_id)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False)
+_cache_local = threading.local()
+
+
+def cache_db():
+    """SQLite-tilkobling til CACHE_DB for denne tråden (opprettes og migreres ved første bruk)."""
+    conn = getattr(_cache_local, "conn", None)
+    if conn is None:
+        ensure_cache_dir()
+        conn = sqlite3.connect(CACHE_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        versjon = conn.execute("PRAGMA user_version").fetchone()[0]
+        if versjon != CACHE_SCHEMA_VERSION:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS entities")
+                conn.execute("""
+                    CREATE TABLE entities (
+                        kind TEXT NOT NULL,
+                        entity_id TEXT NOT NULL,
+                        fetched_at REAL NOT NULL,
+                        payload BLOB NOT NULL,
+                        PRIMARY KEY (kind, entity_id)
+                    )
+                """)
+                conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+        _cache_local.conn = conn
+    return conn
+
+
+def _encode_payload(data):
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def _decode_payload(payload):
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def load_cached(kind, entity_id, max_age=None):
+    """Leser en cachet oppføring, eller None hvis den mangler eller er eldre enn max_age sekunder."""
+    row = cache_db().execute(
+        "SELECT fetched_at, payload FROM entities WHERE kind = ? AND entity_id = ?",
+        (kind, str(entity_id)),
+    ).fetchone()
+    if row is None or (max_age is not None and time.time() - row[0] > max_age):
+        return None
+    return _decode_payload(row[1])
+
+
+def load_all_cached(kind, max_age=None):
+    """Alle ferske oppføringer av en type i én spørring: {entity_id (str): data}."""
+    sql = "SELECT entity_id, payload FROM entities WHERE kind = ?"
+    args = [kind]
+    if max_age is not None:
+        sql += " AND fetched_at >= ?"
+        args.append(time.time() - max_age)
+    return {entity_id: _decode_payload(payload) for entity_id, payload in cache_db().execute(sql, args)}
+
+
+def stale_entities(kind, max_age):
+    """ID-er (str) for oppføringer av en type som er eldre enn max_age sekunder."""
+    rows = cache_db().execute(
+        "SELECT entity_id FROM entities WHERE kind = ? AND fetched_at < ?",
+        (kind, time.time() - max_age),
+    )
+    return [entity_id for (entity_id,) in rows]
+
+
+def save_cached(kind, entity_id, data, fetched_at=None):
+    """Skriver en oppføring i én transaksjon (en krasj etterlater aldri en halv oppføring)."""
+    conn = cache_db()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO entities (kind, entity_id, fetched_at, payload) VALUES (?, ?, ?, ?)",
+            (kind, str(entity_id), fetched_at or time.time(), _encode_payload(data)),
+        )
 
 
-def fetch_league_table(liga_name, liga_id):
-    """Henter ligatabell, med caching."""
-    cached = load_cached("league", liga_id)
+def migrate_json_cache():
+    """Flytter gamle league_<id>.json/team_<id>.json fra backtest_cache inn i databasen
+    (med filens mtime som hentetidspunkt) og sletter filene. Returnerer antall flyttet."""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    filer = []
+    for navn in os.listdir(CACHE_DIR):
+        kind, _, rest = navn.partition("_")
+        if kind in ("league", "team") and rest.endswith(".json"):
+            filer.append((kind, rest[:-len(".json")], os.path.join(CACHE_DIR, navn)))
+
+    flyttet = []
+    slett = []
+    conn = cache_db()
+    with conn:
+        for kind, entity_id, path in filer:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except ValueError:
+                slett.append(path)  # halvskrevet fil: hentes på nytt
+                continue
+            except OSError:
+                continue
+            conn.execute(
+                "INSERT OR IGNORE INTO entities (kind, entity_id, fetched_at, payload) VALUES (?, ?, ?, ?)",
+                (kind, entity_id, os.path.getmtime(path), _encode_payload(data)),
+            )
+            flyttet.append(path)
+    for path in flyttet + slett:
+        os.remove(path)
+    return len(flyttet)
+
+
+def fetch_league_table(liga_name, liga_id, max_age=CACHE_MAX_AGE):
+    """Henter ligatabell, med caching. Utdaterte filer revalideres mot FotMob
+    (billig 304 via HTTP-cachen i fotmob_api); feiler det, brukes den gamle filen."""
+    cached = load_cached("league", liga_id, max_age)
     if cached:
         return cached
     print(f"  Henter tabell for {liga_name} (id={liga_id})...")
     data = hent_fotmob_tabell(liga_id)
     if data:
         save_cached("league", liga_id, data)
-        time.sleep(1)
-    return data
+        return data
+    return load_cached("league", liga_id)
 
 
-def fetch_team_data(team_id):
-    """Henter lagdata, med caching."""
-    cached = load_cached("team", team_id)
+def fetch_team_data(team_id, max_age=CACHE_MAX_AGE):
+    """Henter lagdata, med caching (se fetch_league_table)."""
+    cached = load_cached("team", team_id, max_age)
     if cached:
         return cached
     print(f"  Henter lag {team_id}...")
     data = hent_fotmob_team(team_id)
     if data:
         save_cached("team", team_id, data)
-        time.sleep(1)
-    return data
+        return data
+    return load_cached("team", team_id)
+
 
+def make_rate_limiter(rate, burst=1):
+    """
+    Token bucket for asyncio: i snitt maks `rate` forespørsler per sekund, med inntil
+    `burst` på rad. Returnerer en korutinefunksjon som venter til et token er ledig.
+    rate <= 0 gir ingen begrensning.
+    """
+    tokens = burst
+    sist = None
+    lock = asyncio.Lock()
+
+    async def vent():
+        nonlocal tokens, sist
+        if rate <= 0:
+            return
+        async with lock:
+            loop = asyncio.get_running_loop()
+            naa = loop.time()
+            if sist is not None:
+                tokens = min(burst, tokens + (naa - sist) * rate)
+            sist = naa
+            if tokens < 1:
+                await asyncio.sleep((1 - tokens) / rate)
+                tokens = 0
+                sist = loop.time()
+            else:
+                tokens -= 1
+
+    return vent
+
+
+async def _fetch_limited(cached, fetch, args, limiter, semaphore, max_age):
+    """Ferske cache-treff returneres direkte; ellers kjøres fetch(*args, max_age) i en
+    tråd innenfor samtidighetstaket og rate-grensen."""
+    if cached:
+        return cached
+    async with semaphore:
+        await limiter()
+        return await asyncio.to_thread(fetch, *args, max_age)
+
+
+async def fetch_all_data_async(rate=FETCH_RATE, concurrency=FETCH_CONCURRENCY, max_age=CACHE_MAX_AGE):
+    """
+    Henter alle ligatabeller og lagsider samtidig: hver liga henter tabellen og
+    deretter sine lag, mens alle forespørsler deler én token bucket (rate per
+    sekund) og én semafor (concurrency samtidige). Ferske oppføringer i
+    backtest_cache lastes i én spørring per type; oppføringer eldre enn max_age
+    sekunder (None = aldri) hentes på nytt.
+    Returnerer (league_data, all_team_data) i BACKTEST_LEAGUES-rekkefølge.
+    """
+    migrert = migrate_json_cache()
+    if migrert:
+        print(f"  Flyttet {migrert} JSON-filer inn i {os.path.basename(CACHE_DB)}")
+    lagret = {kind: load_all_cached(kind, max_age) for kind in ("league", "team")}
+    if max_age is not None:
+        utdatert = stale_entities("team", max_age)
+        if utdatert:
+            print(f"  {len(utdatert)} lag eldre enn {max_age / 3600:g} timer revalideres")
+    limiter = make_rate_limiter(rate, burst=max(1, int(rate)))
+    semaphore = asyncio.Semaphore(concurrency)
+    team_tasks = {}
+
+    def team_task(team_id):
+        # Samme lag i flere ligaer hentes bare én gang
+        if team_id not in team_tasks:
+            team_tasks[team_id] = asyncio.ensure_future(
+                _fetch_limited(lagret["team"].get(str(team_id)), fetch_team_data, (team_id,),
+                               limiter, semaphore, max_age))
+        return team_tasks[team_id]
+
+    async def hent_liga(liga_name, liga_id):
+        ld = await _fetch_limited(lagret["league"].get(str(liga_id)), fetch_league_table, (liga_name, liga_id),
+                                  limiter, semaphore, max_age)
+        if not ld or not ld.get("teams"):
+            return ld, []
+        lag = [(team_name, stats.get("team_id")) for team_name, stats in ld["teams"].items()
+               if stats.get("team_id")]
+        team_data = await asyncio.gather(*(team_task(team_id) for _, team_id in lag))
+        return ld, [(team_name, team_id, td) for (team_name, team_id), td in zip(lag, team_data)]
+
+    per_liga = await asyncio.gather(*(hent_liga(n, i) for n, i in BACKTEST_LEAGUES.items()))
 
-def fetch_all_data():
-    """Henter alle liga- og lagdata."""
-    ensure_cache_dir()
     league_data = {}
     all_team_data = {}
-
-    for liga_name, liga_id in BACKTEST_LEAGUES.items():
+    for liga_name, (ld, lag) in zip(BACKTEST_LEAGUES, per_liga):
         print(f"\n{'='*50}")
         print(f"Liga: {liga_name}")
         print(f"{'='*50}")
 
-        ld = fetch_league_table(liga_name, liga_id)
         if not ld or not ld.get("teams"):
             print(f"  FEIL: Ingen tabelldata for {liga_name}")
             continue
 
         league_data[liga_name] = ld
-        teams = ld["teams"]
-
-        for team_name, stats in teams.items():
-            team_id = stats.get("team_id")
-            if not team_id:
-                continue
+        for team_name, team_id, td in lag:
             if team_id in all_team_data:
                 continue
-
-            td = fetch_team_data(team_id)
             if td:
                 all_team_data[team_id] = td
                 n_fixtures = len(td.get("fixtures", []))
@@ -127,6 +325,11 @@ def fetch_all_data():
     return league_data, all_team_data
 
 
+def fetch_all_data(rate=FETCH_RATE, concurrency=FETCH_CONCURRENCY, max_age=CACHE_MAX_AGE):
+    """Henter alle liga- og lagdata (se fetch_all_data_async)."""
+    return asyncio.run(fetch_all_data_async(rate=rate, concurrency=concurrency, max_age=max_age))
+
+
 # ─────────────────────────────────────────────
 # STEG B: BYGG KAMP-KORPUS
 # ─────────────────────────────────────────────
@@ -159,8 +362,8 @@ def build_match_corpus(league_data, all_team_data):
                 if home_id not in team_ids_in_league or away_id not in team_ids_in_league:
                     continue
 
-                # Dedupliser
-                key = (home_id, away_id, fx["home_goals"], fx["away_goals"])
+                # Dedupliser (på match_id; eldre cache-filer uten ID på lag og score)
+                key = fx.get("match_id") or (home_id, away_id, fx["home_goals"], fx["away_goals"])
                 if key in seen:
                     continue
                 seen.add(key)
@@ -182,8 +385,13 @@ def build_match_corpus(league_data, all_team_data):
                     "away_goals": fx["away_goals"],
                     "result": result,
                     "liga": liga_name,
+                    "date": fx.get("date", ""),
                 })
 
+        # Kronologisk rekkefølge når alle kamper har dato (walk-forward over flere sesonger)
+        if matches and all(m["date"] for m in matches):
+            matches.sort(key=lambda m: m["date"])
+
         corpus[liga_name] = matches
         print(f"{liga_name}: {len(matches)} unike ligakamper")
 
@@ -194,132 +402,359 @@ def build_match_corpus(league_data, all_team_data):
 # STEG C: WALK-FORWARD SIMULERING
 # ─────────────────────────────────────────────
 
-def compute_league_averages(prior_matches):
-    """Beregner ligasnitt fra forutgående kamper."""
-    home_goals = sum(m["home_goals"] for m in prior_matches)
-    away_goals = sum(m["away_goals"] for m in prior_matches)
-    n = len(prior_matches)
-    if n == 0:
-        return 1.4, 1.1
-    return home_goals / n, away_goals / n
-
-
-def compute_team_stats_from_history(prior_matches, team_id):
-    """Beregner hjemme/borte-statistikk for et lag fra historiske kamper."""
-    hjemme_spilt = 0
-    hjemme_scoret = 0
-    hjemme_innsluppet = 0
-    borte_spilt = 0
-    borte_scoret = 0
-    borte_innsluppet = 0
-
-    for m in prior_matches:
-        if m["home_id"] == team_id:
-            hjemme_spilt += 1
-            hjemme_scoret += m["home_goals"]
-            hjemme_innsluppet += m["away_goals"]
-        elif m["away_id"] == team_id:
-            borte_spilt += 1
-            borte_scoret += m["away_goals"]
-            borte_innsluppet += m["home_goals"]
-
+def _new_team_state(form_window):
+    """Løpende tellere for ett lag: hjemme/borte-statistikk og formbuffere."""
     return {
-        "hjemme_spilt": hjemme_spilt,
-        "hjemme_scoret": hjemme_scoret,
-        "hjemme_innsluppet": hjemme_innsluppet,
-        "borte_spilt": borte_spilt,
-        "borte_scoret": borte_scoret,
-        "borte_innsluppet": borte_innsluppet,
+        "kamper": 0,
+        "hjemme_spilt": 0,
+        "hjemme_scoret": 0,
+        "hjemme_innsluppet": 0,
+        "borte_spilt": 0,
+        "borte_scoret": 0,
+        "borte_innsluppet": 0,
+        # (scoret, innsluppet) for siste N hjemme- og bortekamper
+        "hjemme_form": deque(maxlen=form_window),
+        "borte_form": deque(maxlen=form_window),
     }
 
 
-def compute_form_from_history(prior_matches, team_id, is_home, form_window):
-    """Beregner form fra historiske kamper (siste N hjemme/borte-kamper)."""
-    relevante = []
-    for m in reversed(prior_matches):
-        if is_home and m["home_id"] == team_id:
-            relevante.append({
-                "home_goals": m["home_goals"],
-                "away_goals": m["away_goals"],
-                "is_home": True,
-            })
-        elif not is_home and m["away_id"] == team_id:
-            relevante.append({
-                "home_goals": m["home_goals"],
-                "away_goals": m["away_goals"],
-                "is_home": False,
-            })
-        if len(relevante) >= form_window:
-            break
+def team_stats_from_state(team):
+    """Hjemme/borte-statistikk for et lag fra løpende tellere."""
+    return {
+        "hjemme_spilt": team["hjemme_spilt"],
+        "hjemme_scoret": team["hjemme_scoret"],
+        "hjemme_innsluppet": team["hjemme_innsluppet"],
+        "borte_spilt": team["borte_spilt"],
+        "borte_scoret": team["borte_scoret"],
+        "borte_innsluppet": team["borte_innsluppet"],
+    }
 
-    if len(relevante) < 3:
+
+def form_from_buffer(buffer):
+    """Beregner form fra et formbuffer (siste N hjemme- eller bortekamper)."""
+    if len(buffer) < 3:
         return None
 
-    scoret = sum(fx["home_goals"] if fx["is_home"] else fx["away_goals"] for fx in relevante)
-    innsluppet = sum(fx["away_goals"] if fx["is_home"] else fx["home_goals"] for fx in relevante)
+    scoret = sum(s for s, _ in buffer)
+    innsluppet = sum(i for _, i in buffer)
 
     return {
-        "kamper": len(relevante),
-        "scoret_snitt": scoret / len(relevante),
-        "innsluppet_snitt": innsluppet / len(relevante),
+        "kamper": len(buffer),
+        "scoret_snitt": scoret / len(buffer),
+        "innsluppet_snitt": innsluppet / len(buffer),
     }
 
 
-def count_team_matches(prior_matches, team_id):
-    """Teller antall kamper et lag har spilt."""
-    return sum(1 for m in prior_matches if m["home_id"] == team_id or m["away_id"] == team_id)
-
+def iter_walk_forward_features(matches, form_window):
+    """
+    Går gjennom kampene kronologisk og gir modell-input for hver kamp som
+    evalueres, basert kun på forutgående kamper. Ligatotaler, hjemme/borte-tellere
+    og formbuffere per lag oppdateres etter hver kamp, så én gjennomgang er O(n).
+    Gir (posisjon, match, league_avg_home, league_avg_away, h_stats, b_stats, h_form, b_form).
+    """
+    teams = {}
+    total_home_goals = 0
+    total_away_goals = 0
+    n_prior = 0
+
+    for pos, match in enumerate(matches):
+        home = teams.get(match["home_id"])
+        if home is None:
+            home = teams[match["home_id"]] = _new_team_state(form_window)
+        away = teams.get(match["away_id"])
+        if away is None:
+            away = teams[match["away_id"]] = _new_team_state(form_window)
 
-def walk_forward_evaluate(matches, params):
+        # Krev minimum kamper
+        if home["kamper"] >= MIN_MATCHES_BEFORE_EVAL and away["kamper"] >= MIN_MATCHES_BEFORE_EVAL:
+            # Ligasnitt fra forutgående kamper
+            if n_prior == 0:
+                league_avg_home, league_avg_away = 1.4, 1.1
+            else:
+                league_avg_home = total_home_goals / n_prior
+                league_avg_away = total_away_goals / n_prior
+
+            yield (
+                pos, match, league_avg_home, league_avg_away,
+                team_stats_from_state(home), team_stats_from_state(away),
+                form_from_buffer(home["hjemme_form"]), form_from_buffer(away["borte_form"]),
+            )
+
+        # Oppdater tellere med denne kampen
+        hg, ag = match["home_goals"], match["away_goals"]
+        total_home_goals += hg
+        total_away_goals += ag
+        n_prior += 1
+
+        home["kamper"] += 1
+        home["hjemme_spilt"] += 1
+        home["hjemme_scoret"] += hg
+        home["hjemme_innsluppet"] += ag
+        home["hjemme_form"].append((hg, ag))
+
+        away["kamper"] += 1
+        away["borte_spilt"] += 1
+        away["borte_scoret"] += ag
+        away["borte_innsluppet"] += hg
+        away["borte_form"].append((ag, hg))
+
+
+def build_partition_features(matches, form_window):
     """
-    Walk-forward evaluering av en parameterkombinajon.
-    Returnerer liste med (prediction, actual_result) per kamp.
+    Beregner sesong- og formfeatures for alle evaluerbare kamper i én walk-forward-
+    gjennomgang av én partisjon (én liga). Bare form_window påvirker featurene;
+    form_weight, lambda_min og lambda_max brukes først i predict_from_features, så
+    featurene kan deles av alle kombinasjoner med samme form_window.
+    Returnerer dict med kamper og numpy-arrays (én rad per evaluert kamp).
     """
-    results = []
-    form_window = params.get("form_window", DEFAULT_PARAMS["form_window"])
+    evaluerte = []
+    posisjon = []
+    league_avg_h = []
+    league_avg_b = []
+    season_h = []
+    season_b = []
+    form_h = []
+    form_b = []
+    har_form = []
+
+    for pos, match, league_avg_home, league_avg_away, h_stats, b_stats, h_form, b_form in \
+            iter_walk_forward_features(matches, form_window):
+        styrke = beregn_styrke(h_stats, b_stats, league_avg_home, league_avg_away)
+
+        evaluerte.append(match)
+        posisjon.append(pos)
+        league_avg_h.append(league_avg_home)
+        league_avg_b.append(league_avg_away)
+        season_h.append(styrke["home_attack"] * styrke["away_defense"] * league_avg_home)
+        season_b.append(styrke["away_attack"] * styrke["home_defense"] * league_avg_away)
+
+        if h_form and b_form:
+            form_h.append(h_form["scoret_snitt"] * (b_form["innsluppet_snitt"] / max(league_avg_home, 0.5)))
+            form_b.append(b_form["scoret_snitt"] * (h_form["innsluppet_snitt"] / max(league_avg_away, 0.5)))
+            har_form.append(True)
+        else:
+            form_h.append(0.0)
+            form_b.append(0.0)
+            har_form.append(False)
 
-    for i, match in enumerate(matches):
-        prior = matches[:i]
+    return {
+        "matches": evaluerte,
+        "posisjon": np.array(posisjon, dtype=int),
+        "league_avg_home": np.array(league_avg_h, dtype=float),
+        "league_avg_away": np.array(league_avg_b, dtype=float),
+        "season_h": np.array(season_h, dtype=float),
+        "season_b": np.array(season_b, dtype=float),
+        "form_h": np.array(form_h, dtype=float),
+        "form_b": np.array(form_b, dtype=float),
+        "har_form": np.array(har_form, dtype=bool),
+        "actual": np.array(["HUB".index(m["result"]) for m in evaluerte], dtype=int),
+    }
+
+
+def partition_by_league(matches):
+    """Deler korpuset i uavhengige partisjoner per liga.
+    Returnerer {liga: (posisjoner i korpuset, kamper)} med kampene i korpusrekkefølge."""
+    partisjoner = {}
+    for pos, match in enumerate(matches):
+        posisjoner, kamper = partisjoner.setdefault(match["liga"], ([], []))
+        posisjoner.append(pos)
+        kamper.append(match)
+    return partisjoner
 
-        # Krev minimum kamper
-        h_count = count_team_matches(prior, match["home_id"])
-        a_count = count_team_matches(prior, match["away_id"])
-        if h_count < MIN_MATCHES_BEFORE_EVAL or a_count < MIN_MATCHES_BEFORE_EVAL:
-            continue
 
-        # Beregn ligasnitt
-        league_avg_home, league_avg_away = compute_league_averages(prior)
+def merge_partition_features(deler, form_window):
+    """Slår sammen featurene fra hver partisjon, [(posisjoner, features)], til én
+    featurematrise i korpusrekkefølge med posisjoner i hele korpuset."""
+    if not deler:
+        return build_partition_features([], form_window)
 
-        # Beregn lagstatistikk
-        h_stats = compute_team_stats_from_history(prior, match["home_id"])
-        b_stats = compute_team_stats_from_history(prior, match["away_id"])
+    posisjon = np.concatenate([np.array(pos, dtype=int)[f["posisjon"]] for pos, f in deler])
+    rekkefolge = np.argsort(posisjon, kind="stable")
+    kamper = [m for _, f in deler for m in f["matches"]]
+
+    merged = {
+        k: np.concatenate([f[k] for _, f in deler])[rekkefolge]
+        for k, v in deler[0][1].items() if isinstance(v, np.ndarray)
+    }
+    merged["posisjon"] = posisjon[rekkefolge]
+    merged["matches"] = [kamper[i] for i in rekkefolge]
+    return merged
 
-        # Beregn form
-        h_form = compute_form_from_history(prior, match["home_id"], True, form_window)
-        b_form = compute_form_from_history(prior, match["away_id"], False, form_window)
 
-        # Kjør modell (uten xG — V1 begrensning)
-        pred = beregn_dyp_poisson(
-            h_stats, b_stats, league_avg_home, league_avg_away,
-            h_form, b_form, None, None,
-            params=params,
+def build_feature_matrices(matches, form_windows, workers=1):
+    """
+    Featurematriser for korpuset, én per form_window. Hver liga simuleres som en
+    uavhengig partisjon (ligasnitt og lagtellere bare fra egen liga), memoisert på
+    (ligaens kamper, form_window), så en ny liga bare koster sin egen simulering.
+    Med workers > 1 bygges manglende partisjoner i en prosesspool.
+    Returnerer {form_window: features} med radene i korpusrekkefølge.
+    """
+    partisjoner = partition_by_league(matches)
+    liga_nokler = {liga: corpus_hash(kamper) for liga, (_, kamper) in partisjoner.items()}
+
+    oppgaver = []
+    for liga, (_, kamper) in partisjoner.items():
+        for form_window in form_windows:
+            key = (liga_nokler[liga], form_window)
+            if key not in _FEATURE_CACHE:
+                oppgaver.append((key, kamper, form_window))
+
+    if workers > 1 and len(oppgaver) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(oppgaver))) as pool:
+            futures = {
+                pool.submit(build_partition_features, kamper, form_window): key
+                for key, kamper, form_window in oppgaver
+            }
+            for future in as_completed(futures):
+                _FEATURE_CACHE[futures[future]] = future.result()
+    else:
+        for key, kamper, form_window in oppgaver:
+            _FEATURE_CACHE[key] = build_partition_features(kamper, form_window)
+
+    return {
+        form_window: merge_partition_features(
+            [(pos, _FEATURE_CACHE[(liga_nokler[liga], form_window)])
+             for liga, (pos, _) in partisjoner.items()],
+            form_window,
         )
-        if not pred:
-            continue
+        for form_window in form_windows
+    }
+
+
+def build_feature_matrix(matches, form_window, workers=1):
+    """Featurematrisen for ett form_window (se build_feature_matrices)."""
+    return build_feature_matrices(matches, [form_window], workers)[form_window]
+
+
+def predict_from_features(features, params, avrund=True):
+    """
+    Form-blending og clamp som array-aritmetikk på forhåndsberegnede features
+    (samme formel som fotmob_api.beregn_lambda, uten xG — V1 begrensning),
+    etterfulgt av vektoriserte Poisson H/U/B-sannsynligheter.
+    Returnerer (lambda_h, lambda_b, probs) der probs er n × 3 (H/U/B i %,
+    avrundet til 0.1 med avrund=True).
+    """
+    form_weight = params.get("form_weight", DEFAULT_PARAMS["form_weight"])
+    lambda_min = params.get("lambda_min", DEFAULT_PARAMS["lambda_min"])
+    lambda_max = params.get("lambda_max", DEFAULT_PARAMS["lambda_max"])
+
+    har_form = features["har_form"]
+    season_weight = 1.0 - form_weight
+    lambda_h = np.where(har_form, season_weight * features["season_h"] + form_weight * features["form_h"],
+                        features["season_h"])
+    lambda_b = np.where(har_form, season_weight * features["season_b"] + form_weight * features["form_b"],
+                        features["season_b"])
+    lambda_h = np.maximum(lambda_min, np.minimum(lambda_h, lambda_max))
+    lambda_b = np.maximum(lambda_min, np.minimum(lambda_b, lambda_max))
+
+    if len(lambda_h) == 0:
+        return lambda_h, lambda_b, np.zeros((0, 3))
+
+    probs = np.stack(beregn_hub_batch(lambda_h, lambda_b), axis=-1)
+    if avrund:
+        probs = np.round(probs, 1)
+    return lambda_h, lambda_b, probs
+
+
+def evaluate_features(features, params):
+    """Metrics for én parameterkombinasjon direkte fra featurematrisen."""
+    _, _, probs = predict_from_features(features, params)
+    return compute_metrics_from_arrays(probs, features["actual"])
+
+
+def evaluate_features_objective(features, params):
+    """
+    Som evaluate_features, men returnerer også urundet gjennomsnittlig log-loss.
+    De avrundede metricsene er stykkevis konstante i parametrene (sannsynligheter
+    på 0.1 pp, log-loss på 4 desimaler), så optimereren må få den urundede verdien.
+    Returnerer (metrics, log_loss); log_loss er 999 uten evaluerte kamper.
+    """
+    _, _, probs = predict_from_features(features, params, avrund=False)
+    metrics = compute_metrics_from_arrays(np.round(probs, 1), features["actual"])
+    if metrics["n"] == 0:
+        return metrics, 999
+    _, total_log_loss, _ = _metric_totals(probs[np.newaxis], features["actual"])
+    return metrics, float(total_log_loss[0]) / metrics["n"]
+
+
+def evaluate_combo_tensor(features, param_list, max_elementer=TENSOR_MAX_ELEMENTER):
+    """
+    Evaluerer mange parameterkombinasjoner (samme form_window) i ett pass:
+    form_weight, lambda_min og lambda_max blir en ekstra array-akse, så lambdaer,
+    Poisson-sannsynligheter og log-loss/Brier per kombinasjon kommer ut av de samme
+    numpy-reduksjonene. Kombinasjonene deles i biter slik at pmf-tabellene
+    holder seg under max_elementer tall.
+    Returnerer liste med metrics i samme rekkefølge som param_list.
+    """
+    n = len(features["actual"])
+    if n == 0:
+        return [compute_metrics_from_arrays(np.zeros((0, 3)), features["actual"]) for _ in param_list]
+
+    def kolonne(navn):
+        return np.array([p.get(navn, DEFAULT_PARAMS[navn]) for p in param_list], dtype=float)[:, np.newaxis]
+
+    form_weight = kolonne("form_weight")
+    lambda_min = kolonne("lambda_min")
+    lambda_max = kolonne("lambda_max")
+
+    har_form = features["har_form"]
+    per_bit = max(1, max_elementer // (n * 9))
+    metrics = []
 
-        # Bestem predikert resultat
-        probs = {"H": pred["H"], "U": pred["U"], "B": pred["B"]}
-        predicted = max(probs, key=probs.get)
+    for start in range(0, len(param_list), per_bit):
+        fw = form_weight[start:start + per_bit]
+        season_weight = 1.0 - fw
+        lambda_h = np.where(har_form, season_weight * features["season_h"] + fw * features["form_h"],
+                            features["season_h"])
+        lambda_b = np.where(har_form, season_weight * features["season_b"] + fw * features["form_b"],
+                            features["season_b"])
+        lambda_h = np.maximum(lambda_min[start:start + per_bit],
+                              np.minimum(lambda_h, lambda_max[start:start + per_bit]))
+        lambda_b = np.maximum(lambda_min[start:start + per_bit],
+                              np.minimum(lambda_b, lambda_max[start:start + per_bit]))
 
+        # (kombinasjoner × kamper × H/U/B)
+        probs = np.round(np.stack(beregn_hub_batch(lambda_h, lambda_b), axis=-1), 1)
+
+        correct, total_log_loss, total_brier = _metric_totals(probs, features["actual"])
+        for j in range(len(fw)):
+            metrics.append(_metrics_dict(int(correct[j]), float(total_log_loss[j]), float(total_brier[j]), n))
+
+    return metrics
+
+
+def walk_forward_evaluate(matches, params):
+    """
+    Walk-forward evaluering av en parameterkombinajon.
+    Returnerer liste med (prediction, actual_result) per kamp.
+    Featurene memoiseres per liga (se build_feature_matrices), så gjentatte kall
+    bare koster prediksjonen.
+    """
+    form_window = params.get("form_window", DEFAULT_PARAMS["form_window"])
+    return results_from_features(build_feature_matrix(matches, form_window), params)
+
+
+def results_from_features(features, params):
+    """Bygger resultatlisten (én dict per evaluert kamp) fra featurematrisen."""
+    lambda_h, lambda_b, probs = predict_from_features(features, params)
+
+    predicted = probs.argmax(axis=1).tolist() if len(probs) else []
+    lambda_h = lambda_h.tolist()
+    lambda_b = lambda_b.tolist()
+    probs = probs.tolist()
+
+    results = []
+    for i, match in enumerate(features["matches"]):
+        prob_h, prob_u, prob_b = probs[i]
         results.append({
             "match": match,
-            "predicted": predicted,
+            "predicted": "HUB"[predicted[i]],
             "actual": match["result"],
-            "prob_H": pred["H"],
-            "prob_U": pred["U"],
-            "prob_B": pred["B"],
-            "lambda_h": pred["lambda_h"],
-            "lambda_b": pred["lambda_b"],
+            "prob_H": prob_h,
+            "prob_U": prob_u,
+            "prob_B": prob_b,
+            "lambda_h": round(lambda_h[i], 2),
+            "lambda_b": round(lambda_b[i], 2),
         })
 
     return results
@@ -334,30 +769,48 @@ def compute_metrics(results):
     if not results:
         return {"accuracy": 0, "log_loss": 999, "brier": 999, "n": 0}
 
-    correct = 0
-    total_log_loss = 0
-    total_brier = 0
-    n = len(results)
+    probs = np.array([[r["prob_H"], r["prob_U"], r["prob_B"]] for r in results], dtype=float)
+    actual = np.array(["HUB".index(r["actual"]) for r in results], dtype=int)
+    return compute_metrics_from_arrays(probs, actual)
 
-    for r in results:
-        actual = r["actual"]
-        predicted = r["predicted"]
 
-        if predicted == actual:
-            correct += 1
+def compute_metrics_from_arrays(probs, actual):
+    """
+    Samme metrics som compute_metrics, fra arrays.
+    probs: n × 3 med H/U/B i prosent, actual: indekser (0=H, 1=U, 2=B).
+    """
+    n = len(actual)
+    if n == 0:
+        return {"accuracy": 0, "log_loss": 999, "brier": 999, "n": 0}
+
+    correct, total_log_loss, total_brier = _metric_totals(probs[np.newaxis], actual)
+    return _metrics_dict(int(correct[0]), float(total_log_loss[0]), float(total_brier[0]), n)
 
-        # Sannsynligheter
-        prob_map = {"H": r["prob_H"] / 100, "U": r["prob_U"] / 100, "B": r["prob_B"] / 100}
 
-        # Log loss
-        actual_prob = max(prob_map[actual], 1e-10)
-        total_log_loss += -math.log(actual_prob)
+def _metric_totals(probs, actual):
+    """
+    Summerer treff, log-loss og Brier langs kamp-aksen.
+    probs: (k, n, 3) — k kombinasjoner — med H/U/B i prosent.
+    Returnerer tre arrays med lengde k.
+    """
+    n = len(actual)
+    p = probs / 100
+    rader = np.arange(n)
 
-        # Brier score
-        for outcome in ["H", "U", "B"]:
-            actual_val = 1.0 if outcome == actual else 0.0
-            total_brier += (prob_map[outcome] - actual_val) ** 2
+    correct = (probs.argmax(axis=-1) == actual).sum(axis=-1)
 
+    # Log loss
+    actual_prob = np.maximum(p[:, rader, actual], 1e-10)
+    total_log_loss = -np.log(actual_prob).sum(axis=-1)
+
+    # Brier score
+    fasit = (actual[:, np.newaxis] == np.arange(3)).astype(float)
+    total_brier = ((p - fasit) ** 2).sum(axis=-1).sum(axis=-1)
+
+    return correct, total_log_loss, total_brier
+
+
+def _metrics_dict(correct, total_log_loss, total_brier, n):
     return {
         "accuracy": round(correct / n * 100, 2),
         "log_loss": round(total_log_loss / n, 4),
@@ -367,6 +820,15 @@ def compute_metrics(results):
     }
 
 
+# Parametrene som påvirker prediksjonene (ikke value_threshold_pp)
+MODEL_PARAM_KEYS = ("form_window", "form_weight", "lambda_min", "lambda_max", "xg_weight")
+
+
+def model_params_key(params):
+    """Nøkkel for parametrene som påvirker prediksjonene (MODEL_PARAM_KEYS)."""
+    return tuple(params.get(k, DEFAULT_PARAMS[k]) for k in MODEL_PARAM_KEYS)
+
+
 def generate_param_combos(grid):
     """Genererer alle parameterkombinasjoner fra griden."""
     keys = sorted(grid.keys())
@@ -377,27 +839,200 @@ def generate_param_combos(grid):
     return combos
 
 
-def run_grid_search(all_matches):
-    """Kjører grid search over alle parameterkombinasjoner."""
-    combos = generate_param_combos(PARAM_GRID)
+def _init_grid_worker(train_matches):
+    """Initialiserer en arbeiderprosess: kampkorpuset sendes over én gang."""
+    _WORKER_STATE["matches"] = train_matches
+    _WORKER_STATE["features"] = {}
+
+
+def _evaluate_combo_chunk(chunk):
+    """Evaluerer en bit av (idx, params) i en arbeiderprosess. Returnerer [(idx, metrics)]."""
+    features = _WORKER_STATE["features"]
+    out = []
+    for idx, params in chunk:
+        form_window = params["form_window"]
+        if form_window not in features:
+            features[form_window] = build_feature_matrix(_WORKER_STATE["matches"], form_window)
+        out.append((idx, evaluate_features(features[form_window], params)))
+    return out
+
+
+def evaluate_combos(train_matches, combos, workers=1, tensor=False, on_result=None):
+    """
+    Evaluerer alle kombinasjoner på train-settet og returnerer metrics i samme
+    rekkefølge som combos. Kombinasjoner som bare skiller seg i value_threshold_pp
+    evalueres én gang. Med tensor=True evalueres alle kombinasjoner per form_window
+    i ett pass (evaluate_combo_tensor); ellers med workers > 1 fordeles bitene på
+    en prosesspool. on_result(key, metrics) kalles så snart hver unike
+    parameternøkkel er ferdig (brukes til checkpointing).
+    """
+    # Unike modellparametre (value_threshold_pp påvirker ikke prediksjonene)
+    unike = {}
+    for params in combos:
+        unike.setdefault(model_params_key(params), params)
+    nokler = list(unike)
+    metrics_per_key = {}
+
+    if tensor:
+        per_window = defaultdict(list)
+        for key in nokler:
+            per_window[unike[key]["form_window"]].append(key)
+        features_per_window = build_feature_matrices(train_matches, sorted(per_window), workers)
+        for form_window, window_keys in sorted(per_window.items()):
+            features = features_per_window[form_window]
+            window_metrics = evaluate_combo_tensor(features, [unike[key] for key in window_keys])
+            for key, metrics in zip(window_keys, window_metrics):
+                metrics_per_key[key] = metrics
+                if on_result:
+                    on_result(key, metrics)
+            print(f"  form_window={form_window}: {len(window_keys)} unike modellparametre evaluert")
+    elif workers <= 1:
+        features_per_window = {}
+        for i, key in enumerate(nokler):
+            params = unike[key]
+            form_window = params["form_window"]
+            if form_window not in features_per_window:
+                features_per_window[form_window] = build_feature_matrix(train_matches, form_window)
+            metrics_per_key[key] = evaluate_features(features_per_window[form_window], params)
+            if on_result:
+                on_result(key, metrics_per_key[key])
+            if (i + 1) % 50 == 0 or i + 1 == len(nokler):
+                print(f"  [{i+1}/{len(nokler)}] unike modellparametre evaluert")
+    else:
+        # Sorter på form_window så hver bit stort sett trenger ett feature-sett
+        arbeid = sorted(enumerate(nokler), key=lambda x: (unike[x[1]]["form_window"], x[0]))
+        chunk_size = max(1, math.ceil(len(arbeid) / (workers * 4)))
+        chunks = [
+            [(i, unike[key]) for i, key in arbeid[j:j + chunk_size]]
+            for j in range(0, len(arbeid), chunk_size)
+        ]
+        ferdig = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_grid_worker,
+                                 initargs=(train_matches,)) as pool:
+            futures = [pool.submit(_evaluate_combo_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                for i, metrics in future.result():
+                    metrics_per_key[nokler[i]] = metrics
+                    if on_result:
+                        on_result(nokler[i], metrics)
+                    ferdig += 1
+                print(f"  [{ferdig}/{len(nokler)}] unike modellparametre evaluert ({workers} prosesser)")
+
+    return [dict(metrics_per_key[model_params_key(params)]) for params in combos]
+
+
+def corpus_hash(matches):
+    """Stabil hash av kampkorpuset (og oppvarmingskravet), inkl. match_id og dato."""
+    h = hashlib.sha1(f"min={MIN_MATCHES_BEFORE_EVAL};".encode())
+    for m in matches:
+        h.update(f"{m['liga']}|{m.get('match_id')}|{m.get('date', '')}|{m['home_id']}|{m['away_id']}|"
+                 f"{m['home_goals']}|{m['away_goals']};".encode())
+    return h.hexdigest()
+
+
+def result_store_key(matches):
+    """Nøkkel for resultatlageret: korpus, evalueringsversjon og modellparametrene."""
+    return hashlib.sha1(
+        f"eval={EVAL_VERSION};keys={','.join(MODEL_PARAM_KEYS)};{corpus_hash(matches)}".encode()
+    ).hexdigest()
+
+
+def params_hash(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def load_result_store(store_key):
+    """Leser lagrede train-metrics for et korpus. Returnerer {params_hash: metrics}.
+    En halvskrevet siste linje (krasj under skriving) hoppes over."""
+    lagret = {}
+    if not os.path.exists(RESULT_STORE_FILE):
+        return lagret
+    with open(RESULT_STORE_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get("corpus") == store_key:
+                lagret[entry["params_hash"]] = entry["train_metrics"]
+    return lagret
+
+
+def open_result_store():
+    """Åpner resultatlageret for tillegg (én filhandle for hele kjøringen)."""
+    # Avslutt en eventuell halvskrevet linje fra et tidligere krasj
+    avslutt_linje = False
+    if os.path.exists(RESULT_STORE_FILE) and os.path.getsize(RESULT_STORE_FILE) > 0:
+        with open(RESULT_STORE_FILE, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            avslutt_linje = f.read(1) != b"\n"
+    f = open(RESULT_STORE_FILE, "a", encoding="utf-8")
+    if avslutt_linje:
+        f.write("\n")
+    return f
+
+
+def append_result_store(f, store_key, combos, metrics):
+    """Legger til train-metrics for kombinasjonene i den åpne lagerfilen f."""
+    for params in combos:
+        f.write(json.dumps({
+            "corpus": store_key,
+            "params_hash": params_hash(params),
+            "params": params,
+            "train_metrics": metrics,
+        }, ensure_ascii=False) + "\n")
+    f.flush()
+
+
+def run_grid_search(all_matches, workers=1, tensor=False, grid=None, store=True):
+    """Kjører grid search over alle parameterkombinasjoner (default: PARAM_GRID).
+    Med store=True hentes allerede evaluerte kombinasjoner fra RESULT_STORE_FILE,
+    og nye skrives dit etter hvert som de blir ferdige."""
+    combos = generate_param_combos(grid or PARAM_GRID)
     print(f"\nGrid search: {len(combos)} parameterkombinasjoner")
     print(f"Totalt {len(all_matches)} kamper å evaluere\n")
 
     # Split i train/test
-    split_idx = int(len(all_matches) * TRAIN_RATIO)
-    train_matches = all_matches[:split_idx]
-    test_matches = all_matches[split_idx:]
+    train_matches, test_matches = split_train_test(all_matches)
     print(f"Train: {len(train_matches)} kamper, Test: {len(test_matches)} kamper\n")
 
     best_train = None
     best_train_metrics = {"log_loss": 999}
     all_results = []
 
-    for idx, params in enumerate(combos):
-        # Evaluer på train-set
-        train_results = walk_forward_evaluate(train_matches, params)
-        train_metrics = compute_metrics(train_results)
-
+    # Evaluer på train-set (hopp over kombinasjoner som allerede ligger i lageret)
+    lagret = {}
+    on_result = None
+    lagerfil = None
+    if store:
+        store_key = result_store_key(train_matches)
+        lagret = load_result_store(store_key)
+        mangler = [p for p in combos if params_hash(p) not in lagret]
+        print(f"{len(combos) - len(mangler)} kombinasjoner hentet fra {os.path.basename(RESULT_STORE_FILE)}, "
+              f"{len(mangler)} gjenstår\n")
+
+        mangler_per_key = defaultdict(list)
+        for params in mangler:
+            mangler_per_key[model_params_key(params)].append(params)
+        if mangler:
+            lagerfil = open_result_store()
+
+        def on_result(key, metrics):
+            append_result_store(lagerfil, store_key, mangler_per_key.get(key, []), metrics)
+    else:
+        mangler = combos
+
+    try:
+        nye_metrics = evaluate_combos(train_matches, mangler, workers=workers, tensor=tensor, on_result=on_result)
+    finally:
+        if lagerfil is not None:
+            lagerfil.close()
+    for params, metrics in zip(mangler, nye_metrics):
+        lagret[params_hash(params)] = metrics
+    combo_metrics = [dict(lagret[params_hash(params)]) for params in combos]
+
+    # Velg beste i kombinasjonsrekkefølge (uavhengig av når prosessene ble ferdige)
+    for idx, (params, train_metrics) in enumerate(zip(combos, combo_metrics)):
         all_results.append({
             "params": params,
             "train_metrics": train_metrics,
@@ -411,6 +1046,18 @@ def run_grid_search(all_matches):
             print(f"  [{idx+1}/{len(combos)}] Acc={train_metrics['accuracy']}% "
                   f"LogLoss={train_metrics['log_loss']} n={train_metrics['n']}")
 
+    return finalize_search(best_train, best_train_metrics, all_results, train_matches, test_matches)
+
+
+def split_train_test(all_matches):
+    """Kronologisk train/test-split etter TRAIN_RATIO."""
+    split_idx = int(len(all_matches) * TRAIN_RATIO)
+    return all_matches[:split_idx], all_matches[split_idx:]
+
+
+def finalize_search(best_train, best_train_metrics, all_results, train_matches, test_matches):
+    """Evaluerer beste og standard parametre på test-settet og bygger resultat-dicten
+    som save_results bruker (felles for alle søkestrategier)."""
     # Evaluer beste på test-set
     print(f"\nBeste parametre (train): {best_train}")
     print(f"  Train: {best_train_metrics}")
@@ -440,21 +1087,187 @@ def run_grid_search(all_matches):
     }
 
 
+def slice_features(features, andel):
+    """Featurene for de første andel (0–1] av de evaluerbare kampene i hver liga, i
+    tidsrekkefølge. Hver liga kuttes for seg og etter oppvarmingen (MIN_MATCHES_BEFORE_EVAL),
+    så selv det minste budsjettet har kamper fra alle ligaer. Walk-forward ser bare
+    bakover, så dette er det samme som å bygge featurene på hver ligas prefiks alene."""
+    ligaer = np.array([m["liga"] for m in features["matches"]], dtype=object)
+    maske = np.zeros(len(ligaer), dtype=bool)
+    for liga in set(ligaer):
+        rader = np.flatnonzero(ligaer == liga)
+        maske[rader[:math.ceil(len(rader) * andel)]] = True
+    sliced = {k: v[maske] for k, v in features.items() if isinstance(v, np.ndarray)}
+    sliced["matches"] = [m for m, med in zip(features["matches"], maske) if med]
+    return sliced
+
+
+def run_successive_halving(all_matches, grid=None, eta=3, min_fraction=1 / 9, workers=1):
+    """
+    Successive halving: alle kombinasjoner evalueres først på en kort andel av hver
+    ligas evaluerbare train-kamper, de beste 1/eta (log-loss) går videre, og andelen
+    ganges med eta for hver runde til hele train-settet brukes. Returnerer samme
+    struktur som run_grid_search. all_results inneholder metrics fra siste runde hver
+    kombinasjon nådde, med antall evaluerte kamper i "budget".
+    """
+    if eta < 2:
+        raise ValueError(f"eta må være minst 2 (fikk {eta})")
+    if not 0 < min_fraction <= 1:
+        raise ValueError(f"min_fraction må være i (0, 1] (fikk {min_fraction})")
+
+    combos = generate_param_combos(grid or PARAM_GRID)
+    train_matches, test_matches = split_train_test(all_matches)
+    print(f"\nSuccessive halving: {len(combos)} parameterkombinasjoner, eta={eta}")
+    print(f"Train: {len(train_matches)} kamper, Test: {len(test_matches)} kamper\n")
+
+    unike = {}
+    for params in combos:
+        unike.setdefault(model_params_key(params), params)
+
+    features_per_window = build_feature_matrices(
+        train_matches, sorted({params["form_window"] for params in unike.values()}), workers)
+
+    # Andel av hver ligas evaluerbare kamper per runde
+    andeler = []
+    fraksjon = min_fraction
+    while fraksjon < 1:
+        andeler.append(fraksjon)
+        fraksjon *= eta
+    andeler.append(1)
+
+    gjenstaaende = list(unike)
+    siste_metrics = {}
+    siste_runde = {}
+
+    for runde, andel in enumerate(andeler):
+        per_window = defaultdict(list)
+        for key in gjenstaaende:
+            per_window[unike[key]["form_window"]].append(key)
+        evaluert = 0
+        for form_window, window_keys in per_window.items():
+            features = slice_features(features_per_window[form_window], andel)
+            evaluert = max(evaluert, len(features["actual"]))
+            window_metrics = evaluate_combo_tensor(features, [unike[key] for key in window_keys])
+            for key, metrics in zip(window_keys, window_metrics):
+                siste_metrics[key] = metrics
+                siste_runde[key] = runde
+
+        print(f"  Runde {runde + 1}/{len(andeler)}: {len(gjenstaaende)} kombinasjoner "
+              f"på {evaluert} kamper")
+        if runde == len(andeler) - 1:
+            break
+        if evaluert == 0:
+            # Ingenting å rangere på: la alle gå videre heller enn å kutte tilfeldig
+            continue
+
+        # Behold de beste 1/eta (stabil sortering: rekkefølgen i griden avgjør likhet)
+        behold = max(1, math.ceil(len(gjenstaaende) / eta))
+        gjenstaaende = sorted(
+            gjenstaaende,
+            key=lambda k: siste_metrics[k]["log_loss"] if siste_metrics[k]["n"] > 0 else float("inf"),
+        )[:behold]
+
+    best_train = None
+    best_train_metrics = {"log_loss": 999}
+    all_results = []
+    siste = len(andeler) - 1
+    for params in combos:
+        key = model_params_key(params)
+        train_metrics = dict(siste_metrics[key])
+        # Kombinasjoner uten evaluerte kamper sier ingenting (og ville trukket
+        # sensitiviteten mot accuracy 0)
+        if train_metrics["n"] == 0:
+            continue
+        all_results.append({
+            "params": params,
+            "train_metrics": train_metrics,
+            "budget": train_metrics["n"],
+        })
+        if siste_runde[key] == siste and train_metrics["log_loss"] < best_train_metrics["log_loss"]:
+            best_train_metrics = train_metrics
+            best_train = params
+
+    return finalize_search(best_train, best_train_metrics, all_results, train_matches, test_matches)
+
+
+def run_optimization(all_matches, grid=None, method="Nelder-Mead", max_evals=200, workers=1):
+    """
+    Kontinuerlig optimering av form_weight, lambda_min og lambda_max med en
+    gradientfri scipy-optimerer direkte på urundet train log-loss, én gang per
+    form_window i griden. Evalueringer memoiseres (parametre avrundet til 4 desimaler),
+    så optimereren aldri betaler to ganger for samme punkt. Returnerer samme struktur som
+    run_grid_search; all_results inneholder alle unike evalueringer.
+    """
+    grid = grid or PARAM_GRID
+    train_matches, test_matches = split_train_test(all_matches)
+    navn = sorted(PARAM_BOUNDS)
+    bounds = [PARAM_BOUNDS[k] for k in navn]
+    print(f"\nOptimering ({method}) av {', '.join(navn)} for form_window {grid['form_window']}")
+    print(f"Train: {len(train_matches)} kamper, Test: {len(test_matches)} kamper\n")
+
+    memo = {}
+    all_results = []
+
+    def params_for(x, form_window):
+        params = {
+            "form_window": form_window,
+            "xg_weight": grid["xg_weight"][0],
+            "value_threshold_pp": DEFAULT_PARAMS["value_threshold_pp"],
+        }
+        for k, v, (lo, hi) in zip(navn, x, bounds):
+            params[k] = round(float(min(max(v, lo), hi)), 4)
+        return dict(sorted(params.items()))
+
+    best_train = None
+    best_train_metrics = {"log_loss": 999}
+    best_loss = 999
+    features_per_window = build_feature_matrices(train_matches, grid["form_window"], workers)
+
+    for form_window in grid["form_window"]:
+        features = features_per_window[form_window]
+
+        def objective(x):
+            params = params_for(x, form_window)
+            key = model_params_key(params)
+            if key not in memo:
+                memo[key] = evaluate_features_objective(features, params)
+                all_results.append({"params": params, "train_metrics": dict(memo[key][0])})
+            return memo[key][1]
+
+        x0 = [min(max(DEFAULT_PARAMS[k], lo), hi) for k, (lo, hi) in zip(navn, bounds)]
+        evals_foer = len(memo)
+        if method == "Nelder-Mead":
+            options = {"maxfev": max_evals, "xatol": 1e-3, "fatol": 1e-5}
+        else:
+            options = {"maxfev": max_evals, "xtol": 1e-3, "ftol": 1e-5}
+        res = minimize(objective, x0, method=method, bounds=bounds, options=options)
+        params = params_for(res.x, form_window)
+        metrics, loss = memo[model_params_key(params)]
+        print(f"  form_window={form_window}: LogLoss={metrics['log_loss']} "
+              f"({len(memo) - evals_foer} evalueringer) {params}")
+
+        if loss < best_loss and metrics["n"] > 0:
+            best_loss = loss
+            best_train_metrics = dict(metrics)
+            best_train = params
+
+    print(f"\nTotalt {len(memo)} unike evalueringer")
+    return finalize_search(best_train, best_train_metrics, all_results, train_matches, test_matches)
+
+
 # ─────────────────────────────────────────────
 # STEG E: LAGRE RESULTATER
 # ─────────────────────────────────────────────
 
-def compute_per_league_metrics(all_matches, params):
-    """Beregner metrics per liga."""
-    liga_matches = defaultdict(list)
-    for m in all_matches:
-        liga_matches[m["liga"]].append(m)
+def compute_per_league_metrics(results):
+    """Beregner metrics per liga ved å gruppere én walk-forward-kjøring på liga."""
+    liga_results = defaultdict(list)
+    for r in results:
+        liga_results[r["match"]["liga"]].append(r)
 
     per_liga = {}
-    for liga, matches in liga_matches.items():
-        results = walk_forward_evaluate(matches, params)
-        metrics = compute_metrics(results)
-        per_liga[liga] = metrics
+    for liga, liga_res in liga_results.items():
+        per_liga[liga] = compute_metrics(liga_res)
     return per_liga
 
 
@@ -501,16 +1314,21 @@ def compute_sensitivity(all_results):
     return sensitivity
 
 
-def save_results(grid_results, all_matches):
+def save_results(grid_results, all_matches, workers=1):
     """Lagrer resultater til JSON og CSV."""
     best_params = grid_results["best_params"]
 
-    # Per-liga metrics med beste parametre
-    per_liga_best = compute_per_league_metrics(all_matches, best_params)
-    per_liga_default = compute_per_league_metrics(all_matches, DEFAULT_PARAMS)
+    # Én walk-forward-kjøring per parametersett over hele korpuset, med
+    # ligapartisjonene bygget parallelt (memoisert, så evalueringen under bare predikerer)
+    build_feature_matrices(all_matches, sorted({best_params["form_window"], DEFAULT_PARAMS["form_window"]}), workers)
+    all_results_best = walk_forward_evaluate(all_matches, best_params)
+    all_results_default = walk_forward_evaluate(all_matches, DEFAULT_PARAMS)
+
+    # Per-liga metrics
+    per_liga_best = compute_per_league_metrics(all_results_best)
+    per_liga_default = compute_per_league_metrics(all_results_default)
 
     # Kalibrering
-    all_results_best = walk_forward_evaluate(all_matches, best_params)
     calibration = compute_calibration(all_results_best)
 
     # Sensitivitet
@@ -569,14 +1387,75 @@ def save_results(grid_results, all_matches):
 # MAIN
 # ─────────────────────────────────────────────
 
+def _eta(verdi):
+    """argparse-type for --eta: heltall >= 2 (ellers stopper aldri budsjettøkningen)."""
+    eta = int(verdi)
+    if eta < 2:
+        raise argparse.ArgumentTypeError(f"må være minst 2 (fikk {verdi})")
+    return eta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backtest av Poisson-modellen med grid search.")
+    parser.add_argument(
+        "--search", choices=["grid", "halving", "optimize"], default="grid",
+        help="Søkestrategi: full grid search, successive halving eller kontinuerlig optimering",
+    )
+    parser.add_argument(
+        "--method", choices=["Nelder-Mead", "Powell"], default="Nelder-Mead",
+        help="Optimerer for --search optimize (default: Nelder-Mead)",
+    )
+    parser.add_argument(
+        "--eta", type=_eta, default=3,
+        help="Successive halving: behold 1/eta av kombinasjonene per runde (default: 3)",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=FETCH_RATE,
+        help=f"Maks forespørsler per sekund mot FotMob ved datahenting (default: {FETCH_RATE:g}, 0 = ubegrenset)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=FETCH_CONCURRENCY,
+        help=f"Maks samtidige forespørsler ved datahenting (default: {FETCH_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--max-age", type=float, default=CACHE_MAX_AGE / 3600,
+        help=f"Revalider cachede FotMob-data eldre enn så mange timer (default: {CACHE_MAX_AGE // 3600}, "
+             f"-1 = aldri)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Antall prosesser for parallell grid search og walk-forward per liga (default: 1 = sekvensielt)",
+    )
+    parser.add_argument(
+        "--no-store", action="store_true",
+        help="Ikke les/skriv resultatlageret (backtest_grid_store.jsonl) i grid search",
+    )
+    parser.add_argument(
+        "--tensor", action="store_true",
+        help="Evaluer alle kombinasjoner per form_window som én tensor (--workers brukes bare per liga)",
+    )
+    parser.add_argument(
+        "--grid", choices=["standard", "fin"], default="standard",
+        help="Parametergrid: PARAM_GRID (standard) eller PARAM_GRID_FINE (fin)",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     print("=" * 60)
     print("TippingAnalyse Backtest")
     print("=" * 60)
 
     # Steg A: Hent data
     print("\n--- Steg A: Henter data fra FotMob ---")
-    league_data, all_team_data = fetch_all_data()
+    max_age = None if args.max_age < 0 else args.max_age * 3600
+    if RECORD_DIR:
+        # Innspilling: cachede svar ville hoppet over forespørslene som skal tas opp
+        print(f"  Record-modus ({RECORD_DIR}): revaliderer alle cachede FotMob-data")
+        max_age = 0
+    league_data, all_team_data = fetch_all_data(rate=args.rate, concurrency=args.concurrency, max_age=max_age)
 
     if not league_data:
         print("FEIL: Ingen ligadata hentet. Avslutter.")
@@ -586,7 +1465,8 @@ def main():
     print("\n--- Steg B: Bygger kamp-korpus ---")
     corpus = build_match_corpus(league_data, all_team_data)
 
-    # Kombiner alle kamper i kronologisk rekkefølge (vi bruker fixture-rekkefølgen)
+    # Kombiner alle kamper (fixture-rekkefølgen innen hver liga). Walk-forward kjøres
+    # likevel per liga som uavhengige partisjoner (se build_feature_matrices)
     all_matches = []
     for liga_name, matches in corpus.items():
         all_matches.extend(matches)
@@ -597,13 +1477,20 @@ def main():
 
     print(f"\nTotalt: {len(all_matches)} kamper")
 
-    # Steg D: Grid search
-    print("\n--- Steg D: Grid search ---")
-    grid_results = run_grid_search(all_matches)
+    # Steg D: Parametersøk
+    print("\n--- Steg D: Parametersøk ---")
+    grid = PARAM_GRID_FINE if args.grid == "fin" else PARAM_GRID
+    if args.search == "halving":
+        grid_results = run_successive_halving(all_matches, grid=grid, eta=args.eta, workers=args.workers)
+    elif args.search == "optimize":
+        grid_results = run_optimization(all_matches, grid=grid, method=args.method, workers=args.workers)
+    else:
+        grid_results = run_grid_search(all_matches, workers=args.workers, tensor=args.tensor, grid=grid,
+                                       store=not args.no_store)
 
     # Steg E: Lagre resultater
     print("\n--- Steg E: Lagrer resultater ---")
-    save_results(grid_results, all_matches)
+    save_results(grid_results, all_matches, workers=args.workers)
 
     print("\n" + "=" * 60)
     print("Backtest fullført!")
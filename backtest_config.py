@@ -22,6 +22,23 @@ PARAM_GRID = {
     "lambda_max": [4.0, 5.0, 6.0],
 }
 
+# Finere grid for tensor-evaluering (python backtest.py --tensor --grid fin)
+PARAM_GRID_FINE = {
+    "form_weight": [round(0.05 * i, 2) for i in range(21)],
+    "form_window": [5, 8, 10, 12, 15],
+    "xg_weight": [0.0],
+    "value_threshold_pp": [5, 8, 12],
+    "lambda_min": [0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4],
+    "lambda_max": [3.0, 3.5, 4.0, 4.5, 5.0, 5.5, 6.0],
+}
+
+# Grenser for kontinuerlig optimering (python backtest.py --search optimize)
+PARAM_BOUNDS = {
+    "form_weight": (0.0, 1.0),
+    "lambda_min": (0.05, 0.5),
+    "lambda_max": (3.0, 8.0),
+}
+
 # Minimum kamper per lag før evaluering (oppvarmingsperiode)
 MIN_MATCHES_BEFORE_EVAL = 20
 
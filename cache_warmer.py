@@ -0,0 +1,143 @@
+"""
+Bakgrunnsoppvarming av FotMob-cachen for gjeldende tippekupong.
+
+Henter kupongen fra Norsk Tipping, finner ligaene og lagene som trengs via
+resolve_team, og forhåndshenter tabell, xG og lagsider inn i de prosessvide
+stale-while-revalidate-cachene (og disk-cachen) i fotmob_api. Jo nærmere
+kupongfristen, jo oftere kjøres oppvarmingen.
+
+Startes én gang per Streamlit-server fra app.py (start_cache_warmer), eller
+frittstående: python cache_warmer.py [--en-gang]. Frittstående varmes bare
+disk-cachen, siden minne-cachene tilhører app-prosessen. Både NT-kupongen og
+FotMob-dataene oppdateres i takt med intervallet. Når alle kampene har startet,
+faller intervallet tilbake til det lengste.
+"""
+
+import argparse
+import threading
+from datetime import datetime, timezone
+
+from analyse import nt_kamper, hent_kupongdata
+from fotmob_api import SWR_TTL, hent_nt_kupong
+
+# (tid igjen til frist i sekunder, intervall i sekunder): første rad som passer brukes
+WARM_SCHEDULE = [
+    (2 * 3600, 5 * 60),
+    (12 * 3600, 15 * 60),
+    (48 * 3600, 30 * 60),
+    (None, 60 * 60),
+]
+# Intervall når kupongen ikke kan hentes eller mangler dato
+WARM_RETRY_INTERVAL = 5 * 60
+
+
+# ─────────────────────────────────────────────
+# KUPONG
+# ─────────────────────────────────────────────
+
+def kupong_kamper(nt_json):
+    """Kampene på kupongen som (liga, hjemmelag, bortelag, dato_raw)."""
+    kamper = []
+    for dag in nt_json.get("gameDays", []):
+        for m in dag.get("game", {}).get("matches", []):
+            kamper.append((
+                m.get("arrangement", {}).get("name", ""),
+                m.get("teams", {}).get("home", {}).get("webName", ""),
+                m.get("teams", {}).get("away", {}).get("webName", ""),
+                m.get("date", ""),
+            ))
+    return kamper
+
+
+def kupong_frist(nt_json, naa=None):
+    """Neste avspark på kupongen (UTC): det tidligste som ikke har startet ennå. Har
+    alle kampene startet, gis det siste avsparket (passert frist), og None hvis
+    ingen dato kan leses."""
+    frister = []
+    for _, _, _, dato_raw in kupong_kamper(nt_json):
+        try:
+            dt = datetime.fromisoformat(dato_raw)
+        except (TypeError, ValueError):
+            continue
+        if dt.tzinfo is None:
+            dt = dt.astimezone()
+        frister.append(dt.astimezone(timezone.utc))
+    if not frister:
+        return None
+    naa = naa or datetime.now(timezone.utc)
+    kommende = [dt for dt in frister if dt > naa]
+    return min(kommende) if kommende else max(frister)
+
+
+def neste_intervall(frist, naa=None):
+    """Sekunder til neste oppvarming etter WARM_SCHEDULE."""
+    if frist is None:
+        return WARM_RETRY_INTERVAL
+    naa = naa or datetime.now(timezone.utc)
+    igjen = (frist - naa).total_seconds()
+    if igjen <= 0:
+        # Fristen er passert: kupongen endres ikke før neste publiseres
+        return WARM_SCHEDULE[-1][1]
+    for grense, intervall in WARM_SCHEDULE:
+        if grense is None or igjen <= grense:
+            return intervall
+    return WARM_SCHEDULE[-1][1]
+
+
+# ─────────────────────────────────────────────
+# OPPVARMING
+# ─────────────────────────────────────────────
+
+def varm_opp(nt_json, max_age=0, intervall=None):
+    """Forhåndshenter tabell, xG og lagsider for alle kamper på kupongen (via
+    analyse.hent_kupongdata). max_age > 0 hopper over disk-cachede svar som er
+    yngre enn max_age sekunder. Med intervall revalideres SWR-svar eldre enn
+    intervallet (og max_age kappes til det), så FotMob-dataene holder takten med
+    kupongen nær fristen. Returnerer {"ligaer": n, "lag": n}."""
+    if intervall and max_age:
+        max_age = min(max_age, intervall)
+    data = hent_kupongdata(nt_kamper(nt_json), max_age=max_age, swr_ttl=intervall)
+    return {"ligaer": len(data["liga_data"]), "lag": len(data["team_data"])}
+
+
+def kjor_warmer(stopp=None, en_gang=False, logg=print, max_age=0):
+    """Oppvarmingsløkke: henter kupongen, varmer cachen og sover til neste
+    intervall (kortere nær fristen). Avsluttes når stopp (threading.Event) settes.
+    I app-prosessen er max_age=0 riktig (SWR-cachene revaliderer med ETag);
+    frittstående brukes SWR_TTL, så ferske disk-svar ikke revalideres hver runde.
+    Begge kappes til intervallet, så data eldre enn ett intervall alltid oppdateres."""
+    stopp = stopp or threading.Event()
+    while not stopp.is_set():
+        nt_json, feil = hent_nt_kupong()
+        if nt_json is None:
+            logg(f"Cache-oppvarming: kunne ikke hente kupong ({feil})")
+            frist = None
+        else:
+            frist = kupong_frist(nt_json)
+            try:
+                resultat = varm_opp(nt_json, max_age=max_age, intervall=neste_intervall(frist))
+                logg(f"Cache-oppvarming: {resultat['ligaer']} ligaer, {resultat['lag']} lag (frist {frist})")
+            except Exception as e:
+                logg(f"Cache-oppvarming feilet: {e}")
+
+        if en_gang:
+            break
+        stopp.wait(neste_intervall(frist))
+
+
+def start_cache_warmer():
+    """Starter oppvarmingsløkken i en daemon-tråd. Returnerer (tråd, stopp-event)."""
+    stopp = threading.Event()
+    traad = threading.Thread(target=kjor_warmer, kwargs={"stopp": stopp}, name="cache-warmer", daemon=True)
+    traad.start()
+    return traad, stopp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forhåndshenter FotMob-data for gjeldende tippekupong.")
+    parser.add_argument("--en-gang", action="store_true", help="Kjør én oppvarming og avslutt")
+    args = parser.parse_args()
+    try:
+        kjor_warmer(en_gang=args.en_gang, max_age=SWR_TTL)
+    except KeyboardInterrupt:
+        pass
@@ -1,12 +1,24 @@
 """
 Delt FotMob API- og modellkode.
-Brukes av app.py (med @st.cache_data) og backtest.py (uten caching).
+Brukes av app.py (via stale_while_revalidate) og backtest.py. FotMob-svar caches på disk
+og revalideres med ETag/Last-Modified (se http_get_json).
 """
 
-import requests
+import functools
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
 import unicodedata
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
-from scipy.stats import poisson
 
 from backtest_config import DEFAULT_PARAMS
 
@@ -14,6 +26,11 @@ from backtest_config import DEFAULT_PARAMS
 # KONSTANTER
 # ─────────────────────────────────────────────
 
+# Kan overstyres (f.eks. til en lokal stand-in-server, se stand_in_server.py)
+FOTMOB_BASE_URL = os.environ.get("FOTMOB_BASE_URL", "https://www.fotmob.com").rstrip("/")
+
+NT_API = os.environ.get("NT_API_URL", "https://api.norsk-tipping.no/PoolGamesSportInfo/v1/api/tipping/live-info")
+
 FOTMOB_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36",
     "Accept": "application/json",
@@ -74,6 +91,301 @@ TEAM_NAME_OVERRIDES = {
     "Malmö": "Malmö FF",
 }
 
+# Connection pool per vert: minst like stor som største trådpool som henter
+# samtidig (lagdata i app.py bruker 8 tråder)
+HTTP_POOL_MAXSIZE = 16
+HTTP_TIMEOUT = 10
+# Begrenset eksponentiell backoff (0.5 s, 1 s, 2 s) på rate limiting og serverfeil.
+# Retry-After ignoreres: urllib3 sover ellers så lenge serveren ber om, uten tak
+HTTP_RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+# Alder (sekunder) før et minne-cachet FotMob-svar oppdateres i bakgrunnen (se stale_while_revalidate)
+SWR_TTL = 3600
+# Maks antall argumentsett per stale_while_revalidate-cache (minst nylig brukte kastes)
+SWR_MAX_ENTRIES = 256
+# Disk-cache for FotMob-svar med validatorer (ETag/Last-Modified), delt av app og backtest
+HTTP_CACHE_DIR = os.environ.get("FOTMOB_HTTP_CACHE_DIR",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_cache"))
+# Record-modus: er den satt, lagres alle vellykkede svar her for avspilling med stand_in_server.py
+RECORD_DIR = os.environ.get("FOTMOB_RECORD_DIR") or None
+# Lærte koblinger NT-lagnavn + liga → FotMob team_id (se registrer_alias)
+ALIAS_REGISTRY_FILE = os.environ.get("FOTMOB_ALIAS_FILE",
+                                     os.path.join(os.path.dirname(os.path.abspath(__file__)), "team_aliases.json"))
+# Minste trigram-likhet (Dice, 0-1) for å godta et fuzzy lagnavn; kandidater innenfor
+# marginen fra den beste regnes som like gode (koblingen flagges som tvetydig)
+TRIGRAM_TERSKEL = 0.45
+TRIGRAM_MARGIN = 0.05
+# Stats-fanen brukes bare til å finne xG-listens fetchAllUrl, som sjelden endres
+# (innen en sesong; ved sesongskifte slås den opp på nytt, se finn_xg_url)
+XG_URL_TTL = 7 * 24 * 3600
+# Inkrementelt lager av ferdigspilte kamper per lag (vokser på tvers av sesonger)
+FIXTURE_STORE_DIR = os.environ.get("FOTMOB_FIXTURE_STORE_DIR",
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixture_store"))
+
+
+# ─────────────────────────────────────────────
+# HTTP-SESJON
+# ─────────────────────────────────────────────
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Delt requests.Session for alle kall mot FotMob og Norsk Tipping, med
+    keep-alive per vert, connection pool og retry. Opprettes ved første kall."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE,
+                                      max_retries=HTTP_RETRY)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def http_get(url, headers=FOTMOB_HEADERS, timeout=HTTP_TIMEOUT):
+    """GET via den delte sesjonen. Returnerer requests.Response (etter eventuelle retries)."""
+    r = http_session().get(url, headers=headers, timeout=timeout)
+    if RECORD_DIR and r.status_code == 200:
+        record_response(url, r.text, r.headers.get("Content-Type", "application/json"))
+    return r
+
+
+def recording_key(url):
+    """Nøkkel for et innspilt svar: sti + query (uavhengig av vert, så opptaket kan
+    spilles av fra en annen base-URL)."""
+    parts = urlsplit(url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+
+def record_response(url, body, content_type="application/json"):
+    """Lagrer et rått svar i RECORD_DIR (én JSON-fil per sti + query)."""
+    key = recording_key(url)
+    path = os.path.join(RECORD_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+    _write_json_atomic(path, {"url": url, "key": key, "content_type": content_type, "body": body})
+
+
+def _http_cache_path(url):
+    return os.path.join(HTTP_CACHE_DIR, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+
+def _load_http_cache(url):
+    try:
+        with open(_http_cache_path(url), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if entry.get("url") == url else None
+
+
+def _write_json_atomic(path, data):
+    """Skriver atomisk (temp-fil + os.replace), så samtidige lesere aldri ser en halv fil."""
+    katalog = os.path.dirname(path)
+    os.makedirs(katalog, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=katalog, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _save_http_cache(entry):
+    _write_json_atomic(_http_cache_path(entry["url"]), entry)
+
+
+def http_get_json(url, headers=FOTMOB_HEADERS, timeout=HTTP_TIMEOUT, max_age=0):
+    """
+    GET som returnerer JSON, via disk-cachen i HTTP_CACHE_DIR. Svar yngre enn
+    max_age sekunder brukes uten forespørsel; ellers revalideres med
+    If-None-Match/If-Modified-Since, og 304 leverer kroppen fra disk.
+    Kaster requests-unntak ved HTTP-feil (som raise_for_status).
+    """
+    entry = _load_http_cache(url)
+    if entry and not RECORD_DIR and time.time() - entry["fetched_at"] < max_age:
+        return json.loads(entry["body"])
+
+    conditional = dict(headers or {})
+    if entry and entry.get("etag"):
+        conditional["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        conditional["If-Modified-Since"] = entry["last_modified"]
+
+    r = http_get(url, headers=conditional, timeout=timeout)
+    if r.status_code == 304 and entry:
+        entry["fetched_at"] = time.time()
+        _save_http_cache(entry)
+        if RECORD_DIR:
+            record_response(url, entry["body"])
+        return json.loads(entry["body"])
+
+    r.raise_for_status()
+    data = r.json()
+    _save_http_cache({
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+        "body": r.text,
+    })
+    return data
+
+
+# ─────────────────────────────────────────────
+# SINGLE-FLIGHT
+# ─────────────────────────────────────────────
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_single_flight_stats = {}
+
+
+def single_flight(endpoint):
+    """
+    Dekoratør som slår sammen samtidige kall med samme endepunkt og argumenter
+    i hele prosessen (på tvers av Streamlit-sesjoner og tråder): første kaller
+    gjør forespørselen, de andre venter og får samme resultat (eller unntak).
+    Resultatet deles: ventende kallere får det samme objektet og må ikke endre det
+    (stale_while_revalidate gir kopier videre).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (endpoint, args, tuple(sorted(kwargs.items())))
+            with _inflight_lock:
+                stats = _single_flight_stats.setdefault(endpoint, {"kall": 0, "delt": 0})
+                stats["kall"] += 1
+                flight = _inflight.get(key)
+                leder = flight is None
+                if leder:
+                    flight = _inflight[key] = {"ferdig": threading.Event(), "resultat": None, "feil": None}
+                else:
+                    stats["delt"] += 1
+
+            if not leder:
+                flight["ferdig"].wait()
+                if flight["feil"] is not None:
+                    raise flight["feil"]
+                return flight["resultat"]
+
+            try:
+                flight["resultat"] = fn(*args, **kwargs)
+                return flight["resultat"]
+            except BaseException as e:
+                flight["feil"] = e
+                raise
+            finally:
+                with _inflight_lock:
+                    del _inflight[key]
+                flight["ferdig"].set()
+        return wrapper
+    return decorator
+
+
+_swr_caches = []
+
+
+def stale_while_revalidate(ttl=SWR_TTL, max_entries=SWR_MAX_ENTRIES):
+    """
+    Prosessvid minne-cache som aldri blokkerer på en oppdatering: første kall
+    henter synkront, deretter returneres alltid siste verdi, og er den eldre enn
+    ttl sekunder startes én oppdatering i en bakgrunnstråd. Tomme svar caches ikke,
+    og en mislykket oppdatering beholder den gamle verdien. Maks max_entries
+    argumentsett beholdes (LRU). Verdiene lagres serialisert, så hver kaller får
+    sin egen kopi og kan ikke endre cachen.
+    wrapper.med_status(*args) gir (verdi, utdatert); wrapper.med_versjon(*args) gir i
+    tillegg hentetidspunktet for verdien (None hvis den ikke ble cachet), egnet som
+    nøkkel for avledede cacher, og tar maks_alder= for å overstyre ttl i ett kall
+    (f.eks. tettere oppdatering nær kupongfristen); wrapper.clear() tømmer cachen.
+    Må defineres i en importert modul (ikke i app.py, som kjøres på nytt ved hver interaksjon).
+    """
+    def decorator(fn):
+        cache = {}
+        lock = threading.Lock()
+
+        def oppdater(args):
+            try:
+                verdi = fn(*args)
+            except Exception:
+                verdi = None
+            with lock:
+                entry = cache.get(args)
+                if entry is None:
+                    return
+                if verdi:
+                    entry["verdi"] = pickle.dumps(verdi, pickle.HIGHEST_PROTOCOL)
+                    entry["hentet"] = time.time()
+                entry["oppdaterer"] = False
+
+        def med_versjon(*args, maks_alder=None):
+            with lock:
+                entry = cache.pop(args, None)
+                if entry is not None:
+                    cache[args] = entry  # sist brukt bakerst
+                    utdatert = time.time() - entry["hentet"] > (ttl if maks_alder is None else maks_alder)
+                    if utdatert and not entry["oppdaterer"]:
+                        entry["oppdaterer"] = True
+                        threading.Thread(target=oppdater, args=(args,), daemon=True).start()
+                    data, hentet = entry["verdi"], entry["hentet"]
+            if entry is not None:
+                return pickle.loads(data), utdatert, hentet
+
+            verdi = fn(*args)
+            if not verdi:
+                return verdi, False, None
+            with lock:
+                entry = cache.get(args)
+                if entry is None:
+                    while len(cache) >= max_entries:
+                        cache.pop(next(iter(cache)))
+                    entry = cache[args] = {"verdi": pickle.dumps(verdi, pickle.HIGHEST_PROTOCOL),
+                                           "hentet": time.time(), "oppdaterer": False}
+                data, hentet = entry["verdi"], entry["hentet"]
+            return pickle.loads(data), False, hentet
+
+        def med_status(*args):
+            return med_versjon(*args)[:2]
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            return med_status(*args)[0]
+
+        def clear():
+            with lock:
+                cache.clear()
+
+        wrapper.med_status = med_status
+        wrapper.med_versjon = med_versjon
+        wrapper.clear = clear
+        _swr_caches.append(wrapper)
+        return wrapper
+    return decorator
+
+
+def swr_clear():
+    """Tømmer alle stale_while_revalidate-cacher (f.eks. ved "Oppdater alle data")."""
+    for wrapper in _swr_caches:
+        wrapper.clear()
+
+
+def single_flight_stats():
+    """Tellere per endepunkt: {endpoint: {"kall": n, "delt": n}}, der "delt" er kall
+    som ventet på en pågående forespørsel i stedet for å gjøre sin egen."""
+    with _inflight_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _single_flight_stats.items()}
+
 
 # ─────────────────────────────────────────────
 # HJELPEFUNKSJONER
@@ -84,38 +396,231 @@ def _normalize(s):
     return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii").lower()
 
 
-def resolve_team(lag_stats, lagnavn):
-    """Finner lag i FotMob-tabellen basert på NT-navnet.
-    Returnerer (fotmob_navn, stats_dict) eller (None, None)."""
-    if not lag_stats:
-        return None, None
+# Bokstaver som NFKD ikke dekomponerer (og som _normalize ellers ville fjernet)
+_TRIGRAM_TEGN = str.maketrans({"ø": "o", "Ø": "o", "æ": "ae", "Æ": "ae", "ß": "ss",
+                               "ł": "l", "Ł": "l", "đ": "d", "Đ": "d", "ð": "d", "ı": "i"})
+
+
+def _trigrammer(navn):
+    """Tegn-trigrammer per ord, med ordgrenser ("  ord "), av et normalisert navn."""
+    tekst = _normalize(navn.translate(_TRIGRAM_TEGN))
+    grams = set()
+    for ord_ in "".join(c if c.isalnum() else " " for c in tekst).split():
+        padded = f"  {ord_} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# ─────────────────────────────────────────────
+# ALIAS-REGISTER
+# ─────────────────────────────────────────────
+
+_alias_registry = None
+_alias_lock = threading.Lock()
+
 
-    override = TEAM_NAME_OVERRIDES.get(lagnavn, lagnavn)
+def _alias_key(liga, lagnavn):
+    return f"{liga}|{lagnavn}"
 
-    if override in lag_stats:
-        return override, lag_stats[override]
 
-    if lagnavn in lag_stats:
-        return lagnavn, lag_stats[lagnavn]
+def load_alias_registry():
+    """Alias-registeret fra ALIAS_REGISTRY_FILE: {"liga|NT-navn": oppføring}. Leses én gang per prosess."""
+    global _alias_registry
+    with _alias_lock:
+        if _alias_registry is None:
+            try:
+                with open(ALIAS_REGISTRY_FILE, "r", encoding="utf-8") as f:
+                    _alias_registry = json.load(f)
+            except (OSError, ValueError):
+                _alias_registry = {}
+        return _alias_registry
 
-    l = override.lower()
-    for k, v in lag_stats.items():
-        if l in k.lower() or k.lower() in l:
-            return k, v
 
-    l_norm = _normalize(override)
-    for k, v in lag_stats.items():
-        k_norm = _normalize(k)
-        if l_norm in k_norm or k_norm in l_norm:
-            return k, v
+def alias_oppslag(liga, lagnavn):
+    """Lært kobling for et NT-lagnavn i en liga, eller None."""
+    return load_alias_registry().get(_alias_key(liga, lagnavn))
 
-    første_ord = l_norm.split()[0] if l_norm.split() else ""
-    if første_ord and len(første_ord) > 2:
-        for k, v in lag_stats.items():
-            if første_ord in _normalize(k):
-                return k, v
 
-    return None, None
+def registrer_alias(liga, lagnavn, team_id, fotmob_navn, metode, kandidater):
+    """
+    Lagrer en fuzzy kobling NT-navn + liga → team_id. Er flere FotMob-lag like gode
+    kandidater, flagges koblingen som tvetydig (se tvetydige_aliaser); rett den ved
+    å endre team_id i filen og sette "bekreftet": true. Bekreftede koblinger overskrives ikke.
+    """
+    registry = load_alias_registry()
+    key = _alias_key(liga, lagnavn)
+    entry = {
+        "liga": liga,
+        "nt_navn": lagnavn,
+        "team_id": team_id,
+        "fotmob_navn": fotmob_navn,
+        "metode": metode,
+        "tvetydig": len(kandidater) > 1,
+        "kandidater": kandidater,
+    }
+    with _alias_lock:
+        # Les filen på nytt, så koblinger fra andre prosesser (f.eks. cache_warmer)
+        # og manuelle rettelser ikke overskrives
+        try:
+            with open(ALIAS_REGISTRY_FILE, "r", encoding="utf-8") as f:
+                paa_disk = json.load(f)
+        except (OSError, ValueError):
+            paa_disk = dict(registry)
+        gammel = paa_disk.get(key)
+        if gammel != entry and not (gammel and gammel.get("bekreftet")):
+            paa_disk[key] = entry
+            _write_json_atomic(ALIAS_REGISTRY_FILE, paa_disk)
+        registry.clear()
+        registry.update(paa_disk)
+        return paa_disk[key]
+
+
+def tvetydige_aliaser():
+    """Lærte koblinger med flere like gode kandidater som ikke er bekreftet."""
+    return [e for e in load_alias_registry().values() if e.get("tvetydig") and not e.get("bekreftet")]
+
+
+# ─────────────────────────────────────────────
+# LAGOPPSLAG
+# ─────────────────────────────────────────────
+
+class TeamIndex:
+    """
+    Navneindeks for én ligatabell: lowercase- og normaliserte navn beregnes én gang,
+    og hvert oppslag memoiseres, så gjentatte oppslag er O(1) og nye er O(k) over
+    ferdigberegnede strenger. Prioritet: override, eksakt navn, lært alias (når
+    liga er oppgitt), delstreng (lowercase), delstreng (normalisert) og til slutt
+    beste trigram-likhet over TRIGRAM_TERSKEL (invertert indeks trigram → lag).
+    Fuzzy treff registreres i alias-registeret.
+    """
+
+    def __init__(self, lag_stats):
+        self.lag_stats = lag_stats
+        self.navn = list(lag_stats)
+        self.lower = [k.lower() for k in self.navn]
+        self.norm = [_normalize(k) for k in self.navn]
+        self.by_id = {stats.get("team_id"): k for k, stats in lag_stats.items() if stats.get("team_id")}
+        self.trigrammer = [_trigrammer(k) for k in self.navn]
+        self.trigram_index = {}
+        for i, grams in enumerate(self.trigrammer):
+            for gram in grams:
+                self.trigram_index.setdefault(gram, []).append(i)
+        self._memo = {}
+
+    def finn(self, lagnavn, liga=None):
+        """Returnerer fotmob_navn eller None (memoisert)."""
+        key = (lagnavn, liga)
+        if key not in self._memo:
+            self._memo[key] = self._finn(lagnavn, liga)
+        return self._memo[key]
+
+    def _finn(self, lagnavn, liga):
+        override = TEAM_NAME_OVERRIDES.get(lagnavn, lagnavn)
+
+        if override in self.lag_stats:
+            return override
+
+        if lagnavn in self.lag_stats:
+            return lagnavn
+
+        if liga:
+            alias = alias_oppslag(liga, lagnavn)
+            if alias and alias.get("team_id") in self.by_id:
+                return self.by_id[alias["team_id"]]
+
+        k, metode, kandidater = self._fuzzy(override)
+        if k is not None and liga and self.lag_stats[k].get("team_id"):
+            registrer_alias(liga, lagnavn, self.lag_stats[k]["team_id"], k, metode, kandidater)
+        return k
+
+    def _fuzzy(self, override):
+        """Første fuzzy-trinn med treff: (første treff, metode, alle treff på trinnet)."""
+        l = override.lower()
+        kandidater = [k for k, k_lower in zip(self.navn, self.lower) if l in k_lower or k_lower in l]
+        if kandidater:
+            return kandidater[0], "delstreng", kandidater
+
+        l_norm = _normalize(override)
+        kandidater = [k for k, k_norm in zip(self.navn, self.norm) if l_norm in k_norm or k_norm in l_norm]
+        if kandidater:
+            return kandidater[0], "normalisert", kandidater
+
+        rangert = self._rangert(override)
+        if rangert and rangert[0][1] >= TRIGRAM_TERSKEL:
+            beste = rangert[0][1]
+            kandidater = [k for k, likhet in rangert if likhet >= beste - TRIGRAM_MARGIN]
+            return rangert[0][0], "trigram", kandidater
+
+        return None, None, []
+
+    def kandidater(self, lagnavn, topp_n=5):
+        """Rangerte kandidater [(fotmob_navn, likhet)] etter trigram-likhet, best først."""
+        return self._rangert(TEAM_NAME_OVERRIDES.get(lagnavn, lagnavn), topp_n)
+
+    def _rangert(self, navn, topp_n=5):
+        grams = _trigrammer(navn)
+        if not grams:
+            return []
+        felles = {}
+        for gram in grams:
+            for i in self.trigram_index.get(gram, ()):
+                felles[i] = felles.get(i, 0) + 1
+        scoret = sorted(
+            ((2 * n / (len(grams) + len(self.trigrammer[i])), i) for i, n in felles.items()),
+            key=lambda x: (-x[0], x[1]),
+        )
+        return [(self.navn[i], round(likhet, 3)) for likhet, i in scoret[:topp_n]]
+
+
+# Indekser per tabellversjon ((liga_id, hentetidspunkt) fra stale_while_revalidate, som
+# gir en ny kopi av tabellen ved hvert kall), ellers per tabell-dict
+_team_indexes = {}
+_team_indexes_lock = threading.Lock()
+TEAM_INDEX_MAX = 128
+
+
+def team_index(lag_stats, versjon=None):
+    """TeamIndex for en tabell, bygget én gang per tabellversjon (eller tabell-dict
+    uten versjon) og gjenbrukt. Navneoppslagene avhenger bare av lagnavnene, så
+    kopier av samme versjon deler indeks."""
+    key = ("versjon", versjon) if versjon is not None else ("id", id(lag_stats))
+    with _team_indexes_lock:
+        index = _team_indexes.get(key)
+        if index is not None and (index.lag_stats is lag_stats or
+                                  (versjon is not None and index.navn == list(lag_stats))):
+            return index
+    index = TeamIndex(lag_stats)
+    with _team_indexes_lock:
+        _team_indexes.pop(key, None)
+        while len(_team_indexes) >= TEAM_INDEX_MAX:
+            _team_indexes.pop(next(iter(_team_indexes)))
+        _team_indexes[key] = index
+    return index
+
+
+def resolve_team(lag_stats, lagnavn, liga=None, versjon=None):
+    """Finner lag i FotMob-tabellen basert på NT-navnet (via team_index). Med liga
+    brukes og oppdateres alias-registeret; versjon (tabellens "versjon") lar kopier
+    av samme tabell dele indeks. Returnerer (fotmob_navn, stats_dict) eller (None, None),
+    med stats_dict fra lag_stats."""
+    if not lag_stats:
+        return None, None
+    k = team_index(lag_stats, versjon).finn(lagnavn, liga)
+    return (k, lag_stats[k]) if k is not None else (None, None)
+
+
+# ─────────────────────────────────────────────
+# DATAHENTING: NORSK TIPPING
+# ─────────────────────────────────────────────
+
+def hent_nt_kupong():
+    """Henter gjeldende tippekupong fra Norsk Tipping. Returnerer (json, feilmelding)."""
+    try:
+        r = http_get(NT_API, headers=None)
+        r.raise_for_status()
+        return r.json(), None
+    except Exception as e:
+        return None, str(e)
 
 
 # ─────────────────────────────────────────────
@@ -152,13 +657,40 @@ def _parse_table_row(lag_stats, row, ttype):
         lag_stats[navn]["totalt_spilt"] = spilt
 
 
-def hent_fotmob_tabell(liga_id):
-    """Henter hjemme/borte-tabell fra FotMob, inkl. lag-ID-er og ligasnitt."""
+# liga_id → gjeldende sesong ("selectedSeason") fra siste tabell hentet i prosessen
+_gjeldende_sesong = {}
+
+
+def _liga_url(liga_id, tab):
+    return f"{FOTMOB_BASE_URL}/api/leagues?id={liga_id}&tab={tab}&type=league&timeZone=Europe/Oslo"
+
+
+def _sesong(data):
+    """Sesongen et liga-svar gjelder (f.eks. "2025/2026"), eller None."""
+    return (data.get("details") or {}).get("selectedSeason") or None
+
+
+def gjeldende_sesong(liga_id):
+    """Ligaens gjeldende sesong ifølge sist hentede tabell (i minnet, ellers disk-cachen)."""
+    if liga_id in _gjeldende_sesong:
+        return _gjeldende_sesong[liga_id]
+    entry = _load_http_cache(_liga_url(liga_id, "table"))
+    if not entry:
+        return None
     try:
-        url = f"https://www.fotmob.com/api/leagues?id={liga_id}&tab=table&type=league&timeZone=Europe/Oslo"
-        r = requests.get(url, headers=FOTMOB_HEADERS, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        return _sesong(json.loads(entry["body"]))
+    except (ValueError, AttributeError):
+        return None
+
+
+@single_flight("tabell")
+def hent_fotmob_tabell(liga_id, max_age=0):
+    """Henter hjemme/borte-tabell fra FotMob, inkl. lag-ID-er og ligasnitt.
+    max_age: bruk disk-cachen uten forespørsel hvis den er yngre (sekunder)."""
+    try:
+        data = http_get_json(_liga_url(liga_id, "table"), max_age=max_age)
+        if _sesong(data):
+            _gjeldende_sesong[liga_id] = _sesong(data)
 
         lag_stats = {}
         tabell_liste = data.get("table", [])
@@ -210,45 +742,97 @@ def hent_fotmob_tabell(liga_id):
         return {}
 
 
-def hent_fotmob_team(team_id):
-    """Henter lagets kamper og form fra FotMob."""
+def _fixture_store_path(team_id):
+    return os.path.join(FIXTURE_STORE_DIR, f"team_{team_id}.json")
+
+
+def load_fixture_store(team_id):
+    """Lagrede ferdigspilte kamper for et lag: {"fixtures": {match_id: fixture}, "high_water": utcTime}."""
+    try:
+        with open(_fixture_store_path(team_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"team_id": team_id, "fixtures": {}, "high_water": ""}
+
+
+def merge_fixture_store(team_id, store, nye):
+    """Fletter nye ferdigspilte kamper inn i lageret (nøkkel: match_id), oppdaterer
+    high-water-merket og skriver lageret hvis noe er nytt. Returnerer alle kampene
+    kronologisk (dato, match_id)."""
+    endret = False
+    for fx in nye:
+        key = str(fx["match_id"])
+        if store["fixtures"].get(key) != fx:
+            store["fixtures"][key] = fx
+            endret = True
+            if fx["date"] > store["high_water"]:
+                store["high_water"] = fx["date"]
+    if endret:
+        _write_json_atomic(_fixture_store_path(team_id), store)
+    return sorted(store["fixtures"].values(), key=lambda fx: (fx["date"], str(fx["match_id"])))
+
+
+def _parse_fixture(fx, team_id):
+    """Ferdigspilt kamp fra FotMob til vårt format, eller None (ikke ferdig/ugyldig score)."""
+    status = fx.get("status", {})
+    if not status.get("finished", False):
+        return None
+    home = fx.get("home", {})
+    away = fx.get("away", {})
+    home_score = home.get("score")
+    away_score = away.get("score")
+    if home_score is None or away_score is None:
+        return None
+    try:
+        home_goals = int(home_score)
+        away_goals = int(away_score)
+    except (ValueError, TypeError):
+        return None
+
+    return {
+        "match_id": fx.get("id"),
+        "date": status.get("utcTime") or fx.get("utcTime") or "",
+        "home_id": home.get("id"),
+        "home_name": home.get("name", ""),
+        "away_id": away.get("id"),
+        "away_name": away.get("name", ""),
+        "home_goals": home_goals,
+        "away_goals": away_goals,
+        "is_home": home.get("id") == team_id,
+    }
+
+
+@single_flight("team")
+def hent_fotmob_team(team_id, max_age=0):
+    """Henter lagets kamper og form fra FotMob. Ferdigspilte kamper flettes inn i
+    fixture-lageret: bare kamper etter lagets high-water-merke (eller ukjente) parses,
+    og "fixtures" inneholder hele historikken kronologisk, også fra tidligere sesonger.
+    max_age som for hent_fotmob_tabell."""
     if not team_id:
         return None
     try:
-        url = f"https://www.fotmob.com/api/teams?id={team_id}"
-        r = requests.get(url, headers=FOTMOB_HEADERS, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        url = f"{FOTMOB_BASE_URL}/api/teams?id={team_id}"
+        data = http_get_json(url, max_age=max_age)
 
         result = {"team_id": team_id, "fixtures": [], "form": []}
 
+        store = load_fixture_store(team_id)
+        high_water = store["high_water"]
+        nye = []
         fixtures_data = data.get("fixtures", {})
         all_fixtures = fixtures_data.get("allFixtures", {}).get("fixtures", [])
         for fx in all_fixtures:
-            status = fx.get("status", {})
-            if not status.get("finished", False):
+            match_id = fx.get("id")
+            if match_id is None:
                 continue
-            home = fx.get("home", {})
-            away = fx.get("away", {})
-            home_score = home.get("score")
-            away_score = away.get("score")
-            if home_score is None or away_score is None:
-                continue
-            try:
-                home_goals = int(home_score)
-                away_goals = int(away_score)
-            except (ValueError, TypeError):
+            utc_time = fx.get("status", {}).get("utcTime") or fx.get("utcTime") or ""
+            if str(match_id) in store["fixtures"] and utc_time <= high_water:
                 continue
+            parsed = _parse_fixture(fx, team_id)
+            if parsed:
+                nye.append(parsed)
 
-            result["fixtures"].append({
-                "home_id": home.get("id"),
-                "home_name": home.get("name", ""),
-                "away_id": away.get("id"),
-                "away_name": away.get("name", ""),
-                "home_goals": home_goals,
-                "away_goals": away_goals,
-                "is_home": home.get("id") == team_id,
-            })
+        result["fixtures"] = merge_fixture_store(team_id, store, nye)
 
         overview = data.get("overview", {})
         team_form = overview.get("teamForm", [])
@@ -274,43 +858,67 @@ def hent_fotmob_team(team_id):
         return None
 
 
-def hent_fotmob_xg(liga_id):
-    """Henter xG-data fra FotMob stats-endepunkt. Returnerer dict: lagnavn → xG per kamp."""
+def finn_xg_url(liga_id, max_age=XG_URL_TTL):
+    """Finner fetchAllUrl for ligaens xG-liste via stats-fanen. Stats-svaret caches på
+    disk i max_age sekunder, så URL-en normalt gjenbrukes uten forespørsel. URL-en er
+    sesongbundet og gir ikke 404 ved sesongskifte, så gjelder det cachede svaret en
+    annen sesong enn tabellen (gjeldende_sesong), slås den opp på nytt."""
+    url = _liga_url(liga_id, "stats")
+    data = http_get_json(url, max_age=max_age)
+    sesong = gjeldende_sesong(liga_id)
+    if max_age and sesong and _sesong(data) and _sesong(data) != sesong:
+        data = http_get_json(url)
+
+    for category in data.get("stats", {}).get("teams", []):
+        header = category.get("header", "").lower()
+        if "expected goals" in header and "conceded" not in header and "difference" not in header:
+            return category.get("fetchAllUrl") or None
+    return None
+
+
+@single_flight("xg")
+def hent_fotmob_xg(liga_id, max_age=0):
+    """Henter xG-data fra FotMob. Returnerer dict: lagnavn → xG per kamp.
+    xG-URL-en fra stats-fanen gjenbrukes (finn_xg_url) til den gir 404; da slås den opp på nytt.
+    max_age som for hent_fotmob_tabell."""
     try:
-        url = f"https://www.fotmob.com/api/leagues?id={liga_id}&tab=stats&type=league&timeZone=Europe/Oslo"
-        r = requests.get(url, headers=FOTMOB_HEADERS, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        fetch_url = finn_xg_url(liga_id)
+        if not fetch_url:
+            return {}
+        try:
+            xg_json = http_get_json(fetch_url, max_age=max_age)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            fetch_url = finn_xg_url(liga_id, max_age=0)
+            if not fetch_url:
+                return {}
+            xg_json = http_get_json(fetch_url)
 
-        team_stats = data.get("stats", {}).get("teams", [])
         xg_data = {}
-
-        for category in team_stats:
-            header = category.get("header", "").lower()
-            if "expected goals" in header and "conceded" not in header and "difference" not in header:
-                fetch_url = category.get("fetchAllUrl", "")
-                if fetch_url:
-                    xg_r = requests.get(fetch_url, headers=FOTMOB_HEADERS, timeout=10)
-                    if xg_r.status_code == 200:
-                        xg_json = xg_r.json()
-                        top_lists = xg_json.get("TopLists", [])
-                        if top_lists:
-                            for entry in top_lists[0].get("StatList", []):
-                                team_name = entry.get("ParticipantName", "")
-                                xg_val = entry.get("StatValue")
-                                matches = entry.get("MatchesPlayed", 1)
-                                if xg_val is not None and team_name:
-                                    try:
-                                        xg_data[team_name] = float(xg_val) / max(int(matches), 1)
-                                    except (ValueError, TypeError):
-                                        pass
-                break
+        top_lists = xg_json.get("TopLists", [])
+        if top_lists:
+            for entry in top_lists[0].get("StatList", []):
+                team_name = entry.get("ParticipantName", "")
+                xg_val = entry.get("StatValue")
+                matches = entry.get("MatchesPlayed", 1)
+                if xg_val is not None and team_name:
+                    try:
+                        xg_data[team_name] = float(xg_val) / max(int(matches), 1)
+                    except (ValueError, TypeError):
+                        pass
 
         return xg_data
     except Exception:
         return {}
 
 
+# Prosessvide stale-while-revalidate-versjoner for appen
+hent_fotmob_tabell_swr = stale_while_revalidate()(hent_fotmob_tabell)
+hent_fotmob_team_swr = stale_while_revalidate()(hent_fotmob_team)
+hent_fotmob_xg_swr = stale_while_revalidate()(hent_fotmob_xg)
+
+
 # ─────────────────────────────────────────────
 # MODELL: STYRKE OG FORM
 # ─────────────────────────────────────────────
@@ -363,6 +971,164 @@ def beregn_form_styrke(fixtures, team_id, is_home_team, form_window=None):
     }
 
 
+def beregn_lambda(h_stats, b_stats, league_avg_home, league_avg_away,
+                  h_form=None, b_form=None, h_xg=None, b_xg=None,
+                  params=None):
+    """
+    Beregner forventede mål (lambda) for én kamp: styrkeratings, form-vekting,
+    valgfri xG-justering og clamp.
+    Returnerer (lambda_h, lambda_b, styrke, modell_nivaa).
+    """
+    if params is None:
+        params = DEFAULT_PARAMS
+    styrke = beregn_styrke(h_stats, b_stats, league_avg_home, league_avg_away)
+
+    # Sesongbasert lambda
+    lambda_h_season = styrke["home_attack"] * styrke["away_defense"] * league_avg_home
+    lambda_b_season = styrke["away_attack"] * styrke["home_defense"] * league_avg_away
+
+    modell_nivaa = "Basis (sesongsnitt)"
+
+    form_weight = params.get("form_weight", DEFAULT_PARAMS["form_weight"])
+    xg_weight = params.get("xg_weight", DEFAULT_PARAMS["xg_weight"])
+    lambda_min = params.get("lambda_min", DEFAULT_PARAMS["lambda_min"])
+    lambda_max = params.get("lambda_max", DEFAULT_PARAMS["lambda_max"])
+
+    # Form-blending
+    lambda_h = lambda_h_season
+    lambda_b = lambda_b_season
+    if h_form and b_form:
+        lambda_h_form = h_form["scoret_snitt"] * (b_form["innsluppet_snitt"] / max(league_avg_home, 0.5))
+        lambda_b_form = b_form["scoret_snitt"] * (h_form["innsluppet_snitt"] / max(league_avg_away, 0.5))
+        season_weight = 1.0 - form_weight
+        lambda_h = season_weight * lambda_h_season + form_weight * lambda_h_form
+        lambda_b = season_weight * lambda_b_season + form_weight * lambda_b_form
+        modell_nivaa = "Dyp (form)"
+
+    # xG-justering
+    if h_xg is not None and b_xg is not None and xg_weight > 0:
+        xg_h_factor = h_xg / max(league_avg_home + league_avg_away, 1) * 2
+        xg_b_factor = b_xg / max(league_avg_home + league_avg_away, 1) * 2
+        goal_weight = 1.0 - xg_weight
+        lambda_h = goal_weight * lambda_h + xg_weight * (xg_h_factor * league_avg_home)
+        lambda_b = goal_weight * lambda_b + xg_weight * (xg_b_factor * league_avg_away)
+        modell_nivaa = "Dyp (form+xG)"
+
+    # Clamp
+    lambda_h = max(lambda_min, min(lambda_h, lambda_max))
+    lambda_b = max(lambda_min, min(lambda_b, lambda_max))
+
+    return lambda_h, lambda_b, styrke, modell_nivaa
+
+
+def poisson_pmf_tabell(lambdaer, max_maal=8):
+    """
+    Poisson-sannsynligheter P(0..max_maal mål) for et array av lambdaer.
+    Bygges med rekursjonen p(k) = p(k-1) · λ / k, som er langt billigere enn
+    scipy.stats.poisson.pmf på store arrays. Mål-aksen ligger først, så hvert
+    steg skriver sammenhengende minne: returnerer array med form (max_maal+1, ...).
+    """
+    lambdaer = np.asarray(lambdaer, dtype=float)
+    tabell = np.empty((max_maal + 1,) + lambdaer.shape)
+    tabell[0] = np.exp(-lambdaer)
+    for k in range(1, max_maal + 1):
+        np.multiply(tabell[k - 1], lambdaer / k, out=tabell[k])
+    return tabell
+
+
+def beregn_hub_batch(lambda_h, lambda_b, max_maal=8):
+    """
+    Bare H/U/B-sannsynligheter (i prosent) for mange kamper, uten å bygge
+    score-matrisene: summene over i > j, i == j og i < j regnes fra pmf-vektorene
+    med kumulative summer. Fungerer for vilkårlig form på lambda-arrayene
+    (f.eks. kombinasjoner × kamper i backtesten). Returnerer (H, U, B).
+    """
+    pmf_h = poisson_pmf_tabell(lambda_h, max_maal)
+    pmf_b = poisson_pmf_tabell(lambda_b, max_maal)
+
+    prob_h = np.zeros(pmf_h.shape[1:])
+    prob_u = pmf_h[0] * pmf_b[0]
+    prob_b = np.zeros(pmf_h.shape[1:])
+    kum_h = pmf_h[0].copy()
+    kum_b = pmf_b[0].copy()
+    for k in range(1, max_maal + 1):
+        # Hjemmelaget scorer k og bortelaget færre (og omvendt)
+        prob_h += pmf_h[k] * kum_b
+        prob_b += pmf_b[k] * kum_h
+        prob_u += pmf_h[k] * pmf_b[k]
+        kum_h += pmf_h[k]
+        kum_b += pmf_b[k]
+    total = prob_h + prob_u + prob_b
+
+    return prob_h / total * 100, prob_u / total * 100, prob_b / total * 100
+
+
+def beregn_poisson_batch(lambda_h, lambda_b, max_maal=8, topp_n=3):
+    """
+    Vektorisert Poisson-modell for mange kamper på én gang (f.eks. hele kupongen
+    eller alle kamper i en backtest). Score-matrisene bygges som ytre produkt av
+    pmf-vektorene (poisson_pmf_tabell), så det blir én tabell per lag-side i stedet
+    for 162 pmf-kall per kamp.
+
+    lambda_h, lambda_b: array-lignende med forventede mål per kamp (samme lengde).
+    Returnerer dict med arrays (lengde n) for "H"/"U"/"B" i prosent (uavrundet),
+    "matriser" (n × (max_maal+1) × (max_maal+1), normalisert) og
+    "topp_resultater" (liste per kamp med topp_n (resultat, prosent)-tupler;
+    topp_n=0 hopper over sorteringen når bare H/U/B trengs).
+    """
+    lambda_h = np.atleast_1d(np.asarray(lambda_h, dtype=float))
+    lambda_b = np.atleast_1d(np.asarray(lambda_b, dtype=float))
+    n = len(lambda_h)
+    dim = max_maal + 1
+
+    pmf_h = poisson_pmf_tabell(lambda_h, max_maal).T
+    pmf_b = poisson_pmf_tabell(lambda_b, max_maal).T
+
+    # Score-matrise per kamp: [kamp, hjemmemål, bortemål]
+    matriser = pmf_h[:, :, np.newaxis] * pmf_b[:, np.newaxis, :]
+    total = matriser.sum(axis=(1, 2))
+    matriser = matriser / total[:, np.newaxis, np.newaxis]
+
+    hjemme_maske = np.tril(np.ones((dim, dim), dtype=bool), -1)
+    borte_maske = np.triu(np.ones((dim, dim), dtype=bool), 1)
+    prob_h = matriser[:, hjemme_maske].sum(axis=1)
+    prob_b = matriser[:, borte_maske].sum(axis=1)
+    prob_u = np.einsum("kii->k", matriser)
+
+    # Topp N mest sannsynlige resultater (stabil sortering som før)
+    topp_resultater = [[] for _ in range(n)]
+    if topp_n:
+        flat = matriser.reshape(n, dim * dim)
+        topp_idx = np.argsort(-flat, axis=1, kind="stable")[:, :topp_n]
+        topp_prob = np.take_along_axis(flat, topp_idx, axis=1)
+        topp_resultater = [
+            [(f"{idx // dim}-{idx % dim}", round(float(p) * 100, 1)) for idx, p in zip(rad_idx, rad_prob)]
+            for rad_idx, rad_prob in zip(topp_idx.tolist(), topp_prob.tolist())
+        ]
+
+    return {
+        "H": prob_h * 100,
+        "U": prob_u * 100,
+        "B": prob_b * 100,
+        "matriser": matriser,
+        "topp_resultater": topp_resultater,
+    }
+
+
+def poisson_resultat(batch, i, lambda_h, lambda_b, styrke, modell_nivaa):
+    """Bygger resultat-dicten for kamp nr. i fra beregn_poisson_batch."""
+    return {
+        "H": round(float(batch["H"][i]), 1),
+        "U": round(float(batch["U"][i]), 1),
+        "B": round(float(batch["B"][i]), 1),
+        "lambda_h": round(lambda_h, 2),
+        "lambda_b": round(lambda_b, 2),
+        "styrke": styrke,
+        "topp_resultater": batch["topp_resultater"][i],
+        "modell_nivaa": modell_nivaa,
+    }
+
+
 def beregn_dyp_poisson(h_stats, b_stats, league_avg_home, league_avg_away,
                         h_form=None, b_form=None, h_xg=None, b_xg=None,
                         params=None):
@@ -370,86 +1136,14 @@ def beregn_dyp_poisson(h_stats, b_stats, league_avg_home, league_avg_away,
     Dyp Poisson-modell med styrkeratings, form-vekting og valgfri xG-justering.
     params: dict med modellparametre (bruker DEFAULT_PARAMS hvis None).
     Returnerer dict med sannsynligheter, forventede mål, topp-resultater og modellnivå.
+    For mange kamper samtidig: bruk beregn_lambda + beregn_poisson_batch.
     """
-    if params is None:
-        params = DEFAULT_PARAMS
     try:
-        styrke = beregn_styrke(h_stats, b_stats, league_avg_home, league_avg_away)
-
-        # Sesongbasert lambda
-        lambda_h_season = styrke["home_attack"] * styrke["away_defense"] * league_avg_home
-        lambda_b_season = styrke["away_attack"] * styrke["home_defense"] * league_avg_away
-
-        modell_nivaa = "Basis (sesongsnitt)"
-
-        form_weight = params.get("form_weight", DEFAULT_PARAMS["form_weight"])
-        xg_weight = params.get("xg_weight", DEFAULT_PARAMS["xg_weight"])
-        lambda_min = params.get("lambda_min", DEFAULT_PARAMS["lambda_min"])
-        lambda_max = params.get("lambda_max", DEFAULT_PARAMS["lambda_max"])
-
-        # Form-blending
-        lambda_h = lambda_h_season
-        lambda_b = lambda_b_season
-        if h_form and b_form:
-            lambda_h_form = h_form["scoret_snitt"] * (b_form["innsluppet_snitt"] / max(league_avg_home, 0.5))
-            lambda_b_form = b_form["scoret_snitt"] * (h_form["innsluppet_snitt"] / max(league_avg_away, 0.5))
-            season_weight = 1.0 - form_weight
-            lambda_h = season_weight * lambda_h_season + form_weight * lambda_h_form
-            lambda_b = season_weight * lambda_b_season + form_weight * lambda_b_form
-            modell_nivaa = "Dyp (form)"
-
-        # xG-justering
-        if h_xg is not None and b_xg is not None and xg_weight > 0:
-            xg_h_factor = h_xg / max(league_avg_home + league_avg_away, 1) * 2
-            xg_b_factor = b_xg / max(league_avg_home + league_avg_away, 1) * 2
-            goal_weight = 1.0 - xg_weight
-            lambda_h = goal_weight * lambda_h + xg_weight * (xg_h_factor * league_avg_home)
-            lambda_b = goal_weight * lambda_b + xg_weight * (xg_b_factor * league_avg_away)
-            modell_nivaa = "Dyp (form+xG)"
-
-        # Clamp
-        lambda_h = max(lambda_min, min(lambda_h, lambda_max))
-        lambda_b = max(lambda_min, min(lambda_b, lambda_max))
-
-        # Poisson-grid
-        max_maal = 8
-        score_matrise = np.zeros((max_maal + 1, max_maal + 1))
-        for i in range(max_maal + 1):
-            for j in range(max_maal + 1):
-                score_matrise[i][j] = poisson.pmf(i, lambda_h) * poisson.pmf(j, lambda_b)
-
-        prob_h = 0.0
-        prob_u = 0.0
-        prob_b = 0.0
-        for i in range(max_maal + 1):
-            for j in range(max_maal + 1):
-                p = score_matrise[i][j]
-                if i > j:
-                    prob_h += p
-                elif i == j:
-                    prob_u += p
-                else:
-                    prob_b += p
-
-        total = prob_h + prob_u + prob_b
-
-        # Topp 3 mest sannsynlige resultater
-        flat = []
-        for i in range(max_maal + 1):
-            for j in range(max_maal + 1):
-                flat.append((i, j, score_matrise[i][j]))
-        flat.sort(key=lambda x: x[2], reverse=True)
-        topp_resultater = [(f"{r[0]}-{r[1]}", round(r[2] / total * 100, 1)) for r in flat[:3]]
-
-        return {
-            "H": round(prob_h / total * 100, 1),
-            "U": round(prob_u / total * 100, 1),
-            "B": round(prob_b / total * 100, 1),
-            "lambda_h": round(lambda_h, 2),
-            "lambda_b": round(lambda_b, 2),
-            "styrke": styrke,
-            "topp_resultater": topp_resultater,
-            "modell_nivaa": modell_nivaa,
-        }
+        lambda_h, lambda_b, styrke, modell_nivaa = beregn_lambda(
+            h_stats, b_stats, league_avg_home, league_avg_away,
+            h_form, b_form, h_xg, b_xg, params=params,
+        )
+        batch = beregn_poisson_batch([lambda_h], [lambda_b])
+        return poisson_resultat(batch, 0, lambda_h, lambda_b, styrke, modell_nivaa)
     except Exception:
         return None
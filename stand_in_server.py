@@ -0,0 +1,156 @@
+"""
+Lokal stand-in-server for FotMob og Norsk Tipping.
+
+Spiller av svar spilt inn med FOTMOB_RECORD_DIR (se fotmob_api.record_response),
+med valgfri forsinkelse og feilinjeksjon, så ytelse kan måles reproduserbart og
+offline. Absolutte URL-er til innspilte verter i svarene (f.eks. xG-listens
+fetchAllUrl) skrives om til serverens egen adresse.
+
+Innspilling:   FOTMOB_RECORD_DIR=opptak streamlit run app.py   (eller python backtest.py)
+               Bare svar fra nettverket tas opp. I record-modus bruker fotmob_api aldri
+               disk-cachen uten forespørsel (304 spilles inn fra disk), og backtest.py
+               revaliderer hele SQLite-cachen (som --max-age 0). Minne-cachene i app.py
+               er tomme i en ny prosess, så start Streamlit-serveren på nytt før opptak.
+Avspilling:    python stand_in_server.py --dir opptak --latency 80 --error-rate 0.05
+               FOTMOB_BASE_URL=http://127.0.0.1:8765 \\
+               NT_API_URL=http://127.0.0.1:8765/PoolGamesSportInfo/v1/api/tipping/live-info \\
+               streamlit run app.py
+
+Feilinjeksjon: klienten (fotmob_api.http_session) prøver statuskodene i
+HTTP_RETRY.status_forcelist (429, 500, 502-504) på nytt, så med standardstatus 503
+når bare error_rate^(HTTP_RETRY.total + 1) av forespørslene fram som feil; resten
+måler retry-oppførselen. For å teste feilhåndteringen i koden, bruk en status som
+ikke prøves på nytt, f.eks. --error-status 501. Opptak inneholder bare vellykkede svar.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from fotmob_api import HTTP_RETRY
+
+
+def load_recordings(record_dir):
+    """Leser alle opptak i record_dir. Returnerer {sti + query: opptak}."""
+    recordings = {}
+    for navn in sorted(os.listdir(record_dir)):
+        if not navn.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(record_dir, navn), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            continue
+        recordings[entry["key"]] = entry
+    return recordings
+
+
+def rewrite_hosts(recordings, base_url):
+    """Peker absolutte URL-er til innspilte verter om til base_url (også JSON-escapet form)."""
+    verter = set()
+    for entry in recordings.values():
+        parts = urlsplit(entry["url"])
+        verter.add(f"{parts.scheme}://{parts.netloc}")
+
+    for entry in recordings.values():
+        body = entry["body"]
+        for vert in verter:
+            body = body.replace(vert, base_url).replace(vert.replace("/", "\\/"), base_url.replace("/", "\\/"))
+        entry["body"] = body
+        entry["etag"] = '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+    return recordings
+
+
+def effektiv_feilrate(error_rate, error_status):
+    """Andelen forespørsler som når koden som feil etter klientens retries."""
+    if error_status in HTTP_RETRY.status_forcelist:
+        return error_rate ** (HTTP_RETRY.total + 1)
+    return error_rate
+
+
+def make_handler(recordings, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503):
+    """Lager en request-handler som spiller av recordings. latency og jitter i sekunder;
+    error_rate er andelen forespørsler (per forsøk) som besvares med error_status
+    (se effektiv_feilrate for hva klienten ser etter retries)."""
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if latency or jitter:
+                time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            if error_rate and random.random() < error_rate:
+                self._send(error_status, b"", "text/plain")
+                return
+
+            entry = recordings.get(self.path)
+            if entry is None:
+                self._send(404, b"", "text/plain")
+                return
+
+            if self.headers.get("If-None-Match") == entry["etag"]:
+                self._send(304, None, entry["content_type"], entry["etag"])
+                return
+            self._send(200, entry["body"].encode("utf-8"), entry["content_type"], entry["etag"])
+
+        def _send(self, status, body, content_type, etag=None):
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            if body is not None:
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+
+def make_server(record_dir, host="127.0.0.1", port=8765, latency=0.0, jitter=0.0,
+                error_rate=0.0, error_status=503):
+    """Oppretter (men starter ikke) en ThreadingHTTPServer; port=0 gir en ledig port."""
+    recordings = load_recordings(record_dir)
+    server = ThreadingHTTPServer((host, port), None)
+    base_url = f"http://{host}:{server.server_address[1]}"
+    rewrite_hosts(recordings, base_url)
+    server.RequestHandlerClass = make_handler(recordings, latency, jitter, error_rate, error_status)
+    server.base_url = base_url
+    server.recordings = recordings
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spiller av innspilte FotMob/NT-svar lokalt.")
+    parser.add_argument("--dir", required=True, help="Katalog med opptak (FOTMOB_RECORD_DIR)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Forsinkelse per forespørsel (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Tilfeldig variasjon i forsinkelsen (± ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Andel forespørsler som feiler (0-1)")
+    parser.add_argument("--error-status", type=int, default=503,
+                        help="HTTP-status for injiserte feil (default 503 prøves på nytt av klienten; "
+                             "501 gjør ikke det)")
+    args = parser.parse_args()
+
+    server = make_server(args.dir, args.host, args.port, args.latency / 1000, args.jitter / 1000,
+                         args.error_rate, args.error_status)
+    print(f"Stand-in-server på {server.base_url} med {len(server.recordings)} opptak")
+    print(f"  FOTMOB_BASE_URL={server.base_url}")
+    print(f"  NT_API_URL={server.base_url}/PoolGamesSportInfo/v1/api/tipping/live-info")
+    if args.error_rate:
+        print(f"  Feilrate {args.error_rate:g} per forsøk med status {args.error_status}; etter klientens "
+              f"retries når {effektiv_feilrate(args.error_rate, args.error_status):.4g} fram som feil")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass